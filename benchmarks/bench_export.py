@@ -0,0 +1,188 @@
+#! /usr/bin/env python3
+#######################################################################################################################
+#  Copyright (c) 2023 Vincent LAMBERT
+#  License: MIT
+#######################################################################################################################
+# NOTES
+#
+# Benchmarks each stage of the export pipeline over the hand SVGs bundled with the repository:
+#
+#   python3 benchmarks/bench_export.py --output=before.json
+#   python3 benchmarks/bench_export.py --output=after.json
+#   python3 benchmarks/bench_export.py compare before.json after.json
+#
+# By default the rendering is done by the 'stub' renderer writing a blank PNG, so that the benchmark runs without
+# Inkscape and measures the cost of the pipeline itself. Use --renderer=cli, shell or cairosvg to include the actual
+# renders.
+
+import sys
+import os
+import io
+import glob
+import json
+import time
+import logging
+import argparse
+import platform
+import tempfile
+import contextlib
+import statistics
+
+REPOSITORY_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPOSITORY_PATH)
+import export_hand_poses
+from export_hand_poses import HandPoseExporter, compute_accepted_combinations
+
+FORMAT_VERSION = 1
+
+######################################################################################################################
+
+# Fast stages are run until they took this many seconds, so that their timings are not mostly noise.
+MIN_TIME = 0.5
+MAX_REPEAT = 1000
+
+def measure(function, repeat: int, min_time: float = MIN_TIME) -> dict:
+    """Runs the function at least `repeat` times, and up to MAX_REPEAT times until the runs took `min_time` seconds, 
+       and returns its timings in seconds.
+    """
+    timings = list()
+    while len(timings) < repeat or (sum(timings) < min_time and len(timings) < MAX_REPEAT):
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+    return {"min": min(timings), "median": statistics.median(timings), "repeat": len(timings)}
+
+def make_exporter(svg_path: str, output_path: str, options: argparse.Namespace):
+    exporter = HandPoseExporter()
+    parser = argparse.ArgumentParser()
+    exporter.add_arguments(parser)
+    exporter.options = parser.parse_args([f"--path={output_path}", "--filetype=png", "--multi=true", "--simple=true", "--force=true",
+                                          f"--jobs={options.jobs}", f"--dpi={options.dpi}", 
+                                          f"--renderer={options.renderer}"])
+    exporter.document = export_hand_poses.load_svg(svg_path)
+    return exporter
+
+def bench_view(svg_path: str, options: argparse.Namespace) -> dict:
+    logit = logging.debug
+    quiet = contextlib.redirect_stdout(io.StringIO())
+    results = dict()
+    with tempfile.TemporaryDirectory() as output_path:
+        exporter = make_exporter(svg_path, output_path, options)
+        with quiet:
+            results["compute_accepted_combinations"] = measure(lambda: compute_accepted_combinations(True, True),
+                                                               options.repeat)
+            hand_poses = compute_accepted_combinations(True, True)
+        results["get_layers"] = measure(lambda: exporter.get_layers(logit), options.repeat)
+        results["get_exported_layers"] = measure(lambda: exporter.get_exported_layers(logit), options.repeat)
+        layers = exporter.get_exported_layers(logit)
+        if not layers:
+            return {"skipped": "no layer has an export-hand-poses attribute", "stages": results}
+
+        def update_show_hide():
+            for hand_pose in hand_poses:
+                for finger, status in hand_pose:
+                    exporter.update_show_hide(finger, status, layers, logit)
+        results["update_show_hide"] = measure(update_show_hide, options.repeat)
+
+        shown_layers = list()
+        for hand_pose in hand_poses:
+            show, hide = list(), list()
+            for finger, status in hand_pose:
+                new_show, new_hide = exporter.update_show_hide(finger, status, layers, logit)
+                show.extend(new_show)
+                hide.extend(new_hide)
+            shown_layers.append((show, hide))
+        svg_dest = os.path.join(output_path, "pose.svg")
+
+        def export_layers():
+            for show, hide in shown_layers:
+                exporter.export_layers(svg_dest, show, hide)
+        results["export_layers"] = measure(export_layers, options.repeat)
+        exporter.options.prune, exporter.layer_template = True, None
+        results["export_layers_pruned"] = measure(export_layers, options.repeat)
+        exporter.options.prune, exporter.layer_template = False, None
+        results["render"] = measure(exporter.export, options.repeat)
+    return {"poses": len(hand_poses), "stages": results}
+
+def run(options: argparse.Namespace) -> dict:
+    svg_paths = options.sources or sorted(glob.glob(os.path.join(REPOSITORY_PATH, "handPoses*.svg")))
+    report = {"version": FORMAT_VERSION,
+              "python": platform.python_version(),
+              "platform": platform.platform(),
+              "renderer": options.renderer,
+              "repeat": options.repeat,
+              "views": dict()}
+    for svg_path in svg_paths:
+        name = os.path.basename(svg_path)
+        print(f"Benchmarking {name}", file=sys.stderr)
+        report["views"][name] = bench_view(svg_path, options)
+    return report
+
+######################################################################################################################
+
+def compare(before: dict, after: dict, threshold: float, min_delta: float) -> list:
+    """Returns the (view, stage, before, after) timings whose minimum grew by more than `threshold`, by more than
+       `min_delta` seconds and by more than the noise of both runs, estimated as the spread between their median and
+       their minimum.
+    """
+    regressions = list()
+    for view, view_after in after["views"].items():
+        view_before = before["views"].get(view)
+        if view_before is None:
+            continue
+        for stage, timing_after in view_after["stages"].items():
+            timing_before = view_before["stages"].get(stage)
+            if timing_before is None:
+                continue
+            status = "ok"
+            noise = max(timing_before["median"] - timing_before["min"], timing_after["median"] - timing_after["min"])
+            if timing_after["min"] - timing_before["min"] > max(timing_before["min"] * threshold, min_delta, noise):
+                status = "REGRESSION"
+                regressions.append((view, stage, timing_before["min"], timing_after["min"]))
+            ratio = timing_after["min"] / timing_before["min"] if timing_before["min"] > 0 else float("inf")
+            print(f"{view:28} {stage:30} {timing_before['min'] * 1000:10.3f} ms {timing_after['min'] * 1000:10.3f} ms"
+                  f" {ratio:6.2f}x  {status}")
+    return regressions
+
+def _compare_main(args):
+    parser = argparse.ArgumentParser(prog="bench_export.py compare",
+                                     description="Compares two benchmark results and flags the regressions.")
+    parser.add_argument("before", help="Results of the reference run")
+    parser.add_argument("after", help="Results of the run to check")
+    parser.add_argument("--threshold", type=float, default=0.10,
+                        help="Relative slowdown of a stage above which it is flagged as a regression")
+    parser.add_argument("--min-delta", type=float, default=0.001,
+                        help="Slowdown of a stage in seconds below which it is never flagged as a regression")
+    options = parser.parse_args(args)
+    with open(options.before) as before_file, open(options.after) as after_file:
+        before, after = json.load(before_file), json.load(after_file)
+    if before.get("version") != FORMAT_VERSION or after.get("version") != FORMAT_VERSION:
+        sys.exit(f"Both results must have the format version {FORMAT_VERSION}")
+    regressions = compare(before, after, options.threshold, options.min_delta)
+    if regressions:
+        sys.exit(f"{len(regressions)} stages regressed by more than {options.threshold:.0%}")
+
+def _main():
+    if sys.argv[1:2] == ["compare"]:
+        _compare_main(sys.argv[2:])
+        return
+    parser = argparse.ArgumentParser(description="Benchmarks the stages of the hand poses export.")
+    parser.add_argument("sources", nargs="*", metavar="SOURCE",
+                        help="SVG files to benchmark, the bundled handPoses*.svg files by default")
+    parser.add_argument("--output", default="bench_results.json", help="JSON file receiving the results")
+    parser.add_argument("--renderer", choices=sorted(export_hand_poses.RENDERERS), default="stub",
+                        help="Renderer of the hand poses, 'stub' writing a blank PNG instead of rendering")
+    parser.add_argument("--repeat", type=int, default=5, 
+                        help=f"Minimum number of runs of each stage, the fast ones being run for {MIN_TIME}s")
+    parser.add_argument("--jobs", type=int, default=0, help="Number of parallel exports (0 uses the number of cores)")
+    parser.add_argument("--dpi", type=float, default=90.0, help="DPI of the renders")
+    options = parser.parse_args()
+    report = run(options)
+    with open(options.output, "w") as output_file:
+        json.dump(report, output_file, indent=2)
+    print(f"Results written to {options.output}", file=sys.stderr)
+
+if __name__ == "__main__":
+    _main()
+
+#######################################################################################################################
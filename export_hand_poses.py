@@ -33,16 +33,26 @@
 #   SEE: https://github.com/nshkurkin/inkscape-export-layer-combos
 
 import sys
-sys.path.append('/usr/share/inkscape/extensions')
-import inkex
 import os
+import io
 import subprocess
 import tempfile
 import shutil
 import copy
 from lxml import etree
 import logging
-import itertools
+import argparse
+import contextlib
+import time
+import concurrent.futures
+import hashlib
+import json
+import queue
+import re
+import struct
+import threading
+import zipfile
+import zlib
 
 ######################################################################################################################
 
@@ -58,6 +68,11 @@ ADD_LINK="add-link"
 ABD_LINK="abd-link"
 MULTI_LINK="multi-link"
 
+NSS = {"svg" : "http://www.w3.org/2000/svg",
+       "inkscape" : "http://www.inkscape.org/namespaces/inkscape",
+       "sodipodi" : "http://sodipodi.sourceforge.net/DTD/sodipodi-0.dtd",
+       "xlink" : "http://www.w3.org/1999/xlink"}
+
 FINGERS= [THUMB, INDEX, MIDDLE, RING, PINKY]
 STATUS = [UP, DOWN, ADD_LINK, ABD_LINK, MULTI_LINK]
 
@@ -77,6 +92,8 @@ ACCEPTED_S_LINKS = [{ADD_LINK : INDEX, ABD_LINK : MIDDLE},
                     {ADD_LINK : MIDDLE, ABD_LINK : RING},
                     {ADD_LINK : RING, ABD_LINK : PINKY}]
 
+ABD_FINGER_OF_ADD = {link[ADD_LINK] : link[ABD_LINK] for link in ACCEPTED_S_LINKS}
+
 
 def has_multi_joints(combination) :
     return any([status == MULTI_LINK for finger,status in combination])
@@ -127,48 +144,172 @@ def intersect(list1, list2):
     set3 = set1 & set2
     return list(set3)
     
-def compute_accepted_combinations(multi_link_combo, simple_link_combo) :
-    # Compute all possible combinations of finger other than the thumb and status
-    print("\n\nCompute all possible combinations\n")
+def accepts_multi_links(combination, remaining, multi_link_combo) :
+    # Check if a partial combination can still end with valid multi-links once the remaining fingers are set
+    multi_fingers = [finger for finger,status in combination if status == MULTI_LINK]
+    if multi_fingers == [] :
+        return True
+    if not multi_link_combo or THUMB in multi_fingers :
+        return False
+    # There must be at least 3 multi-links, including both the middle and the ring
+    if len(multi_fingers) + remaining < 3 :
+        return False
+    decided_fingers = [finger for finger,status in combination]
+    return all([finger in multi_fingers for finger in [MIDDLE, RING] if finger in decided_fingers])
+
+def accepts_add_and_abd_links(combination, simple_link_combo) :
+    # Check if a partial combination can still end with each add-link paired with the accepted abd-link
+    statuses = dict(combination)
+    if not simple_link_combo and (ADD_LINK in statuses.values() or ABD_LINK in statuses.values()) :
+        return False
+    for finger, status in combination :
+        if status == ADD_LINK :
+            if finger not in ABD_FINGER_OF_ADD :
+                return False
+            abd_finger = ABD_FINGER_OF_ADD[finger]
+            if abd_finger in statuses and statuses[abd_finger] != ABD_LINK :
+                return False
+        if status == ABD_LINK :
+            add_fingers = [add_finger for add_finger, abd_finger in ABD_FINGER_OF_ADD.items() if abd_finger == finger]
+            if all([add_finger in statuses and statuses[add_finger] != ADD_LINK for add_finger in add_fingers]) :
+                return False
+    return True
+
+def iter_accepted_combinations(multi_link_combo, simple_link_combo, accepted_statuses=ACCEPTED_STATUSES, rules=()) :
+    """Lazily yields the accepted hand poses by only walking the partial combinations of the side fingers that can
+       still lead to an accepted hand pose. The order is the one of itertools.product, the closed hand coming last.
+
+       `accepted_statuses` maps each finger to the statuses it may take, and each rule of `rules` is called with every
+       partial combination of the side fingers, as a list of (finger, status), and returns False to discard it along
+       with all of its completions.
+    """
     fingers = [x for x in FINGERS if x != THUMB]
-    finger_status_combinations = itertools.product(STATUS, repeat=len(fingers))
-    finger_accepted_combinations = [[(finger, status) for finger,status in zip(fingers,statuses)] for statuses in finger_status_combinations]
-    
-    # # Remove unaccepted finger combinations
-    finger_accepted_combinations = [combination for combination in finger_accepted_combinations if all([status in ACCEPTED_STATUSES[finger] for finger,status in combination])]
-    
-    # Handle multi-links combinations if not three side fingers have the same multi-link status
-    new_finger_accepted_combinations = []
-    for combination in finger_accepted_combinations :
-        if has_multi_joints(combination) :
-            if multi_link_combo and has_valid_multi_joints(combination) :
-                new_finger_accepted_combinations.append(combination)
-        else :
-            new_finger_accepted_combinations.append(combination)
-    finger_accepted_combinations = new_finger_accepted_combinations
-    
-    # Handle add-link and abd-link combinations
-    # If a finger is a add-link, then the last side finger must be a abd-link
-    new_finger_accepted_combinations = []
-    for combination in finger_accepted_combinations :
-        if has_add_or_abd_joints(combination) :
-            if simple_link_combo and has_valid_add_and_abd_joints(combination) :
-                new_finger_accepted_combinations.append(combination)
-        else :
-            new_finger_accepted_combinations.append(combination)
-    finger_accepted_combinations = new_finger_accepted_combinations
+    candidates = [[status for status in STATUS if status in accepted_statuses[finger]] for finger in fingers]
     
-    # Combine with the thumb states as one of the fingers
-    # We would combine the thumb with the finger combinations with every thumb hover or touch
-    # context if we needed to with the following line
-    # accepted_combinations = [[x[0], x[1][0],x[1][1],x[1][2],x[1][3]]  for x in itertools.product(*[thumb_accepted_combinations, finger_accepted_combinations])]
-    # However, we only want the thumb to be in the opened state except for the case where every finger is down
-    # That is why we compure the following lines
-    at_least_one_up = [[x[0], x[1][0],x[1][1],x[1][2],x[1][3]]  for x in itertools.product(*[[(THUMB, UP)], finger_accepted_combinations]) if not all([status == DOWN for finger,status in x[1]])]
-    all_closed = [[x[0], x[1][0],x[1][1],x[1][2],x[1][3]]  for x in itertools.product(*[[(THUMB, DOWN)], finger_accepted_combinations]) if all([status == DOWN for finger,status in x[1]])]
-    accepted_combinations = at_least_one_up + all_closed
+    def accepts(combination) :
+        remaining = len(fingers) - len(combination)
+        return accepts_multi_links(combination, remaining, multi_link_combo) \
+            and accepts_add_and_abd_links(combination, simple_link_combo) \
+            and all([rule(combination) for rule in rules])
     
-    return accepted_combinations
+    def walk(combination) :
+        # Depth first walk over the statuses of the side fingers, in the order of itertools.product
+        if len(combination) == len(fingers) :
+            yield combination
+            return
+        for status in candidates[len(combination)] :
+            extended = combination + [(fingers[len(combination)], status)]
+            if accepts(extended) :
+                yield from walk(extended)
+    
+    # The thumb is opened except for the case where every finger is down, which comes last
+    all_closed = None
+    for combination in walk([]) :
+        if all([status == DOWN for finger,status in combination]) :
+            all_closed = [(THUMB, DOWN)] + combination
+        else :
+            yield [(THUMB, UP)] + combination
+    if all_closed is not None :
+        yield all_closed
+
+def label_hand_pose(hand_pose) :
+    # Has as input a hand pose of the form [(finger, status), (finger, status), ...]
+    # Returns a string of the form "finger1_status1_finger2_status2_..."
+    label = ""
+    for finger, status in hand_pose:
+        label = label+"_"+finger.capitalize()+"_"+status.capitalize()
+    return label[1:]
+
+class PoseFilter(object):
+    """Selects hand poses by the status of their fingers and by label. A selection such as 'index=up,middle=*' 
+       is made of comma separated conditions which must all hold, a condition being a finger, '=' or '!=' and
+       '|' separated statuses or '*' for any status. Several selections, given separately or separated by ';', 
+       select the hand poses matching any of them. Labels are compared regardless of their case. Without any
+       selection nor label, every hand pose is selected.
+    """
+
+    def __init__(self, selections=(), labels=()):
+        self.clauses = [clause for selection in selections for clause in PoseFilter.parse(selection)]
+        self.labels = {label.lower() for label in labels}
+        self.matched_labels = set()
+
+    @staticmethod
+    def parse(selection: str) -> list:
+        """Parses a selection into clauses, each a dictionary of the finger conditions as (negated, statuses), where
+           statuses is None for '*'. The conditions on a finger given several times in a clause must all hold, hence
+           are intersected. A ValueError is raised if the selection is invalid.
+        """
+        clauses = list()
+        for clause in selection.split(";"):
+            if not clause.strip():
+                continue
+            conditions = dict()
+            for condition in clause.split(","):
+                negated = "!=" in condition
+                finger, _, statuses = condition.partition("!=" if negated else "=")
+                finger, statuses = finger.strip().lower(), statuses.strip().lower()
+                if finger not in FINGERS:
+                    raise ValueError(f"invalid finger '{finger}' in '{condition.strip()}', expected one of {FINGERS}")
+                if not statuses:
+                    raise ValueError(f"'{condition.strip()}' has no status, expected '[finger]=[status]'")
+                if statuses == "*":
+                    statuses = None
+                else:
+                    statuses = {status.strip() for status in statuses.split("|")}
+                    for status in statuses - set(STATUS):
+                        raise ValueError(f"invalid status '{status}' in '{condition.strip()}', expected one of {STATUS}")
+                if finger in conditions:
+                    allowed = PoseFilter.get_allowed(*conditions[finger]) & PoseFilter.get_allowed(negated, statuses)
+                    negated, statuses = False, allowed
+                conditions[finger] = (negated, statuses)
+            clauses.append(conditions)
+        return clauses
+
+    @staticmethod
+    def get_allowed(negated: bool, statuses) -> set:
+        """Returns the statuses satisfying a condition."""
+        statuses = set(STATUS) if statuses is None else statuses
+        return set(STATUS) - statuses if negated else set(statuses)
+
+    def is_empty(self) -> bool:
+        return not self.clauses and not self.labels
+
+    def matches(self, hand_pose) -> bool:
+        if self.is_empty():
+            return True
+        if label_hand_pose(hand_pose).lower() in self.labels:
+            self.matched_labels.add(label_hand_pose(hand_pose).lower())
+            return True
+        statuses = dict(hand_pose)
+        for conditions in self.clauses:
+            if all((statuses.get(finger) in allowed if allowed is not None else finger in statuses) != negated
+                   for finger, (negated, allowed) in conditions.items()):
+                return True
+        return False
+
+    def filter(self, hand_poses):
+        """Lazily yields the selected hand poses."""
+        for hand_pose in hand_poses:
+            if self.matches(hand_pose):
+                yield hand_pose
+
+    def unmatched_labels(self) -> list:
+        """Returns the labels which did not match any of the filtered hand poses."""
+        return sorted(self.labels - self.matched_labels)
+
+def select_hand_poses(multi_link_combo=True, simple_link_combo=True, selections=(), labels=()) -> list:
+    """Returns the (label, hand pose) of the accepted hand poses which match the selections or labels, as described 
+       by PoseFilter. For instance, select_hand_poses(selections=["index=up,middle=up|down"]).
+    """
+    pose_filter = PoseFilter(selections, labels)
+    return [(label_hand_pose(hand_pose), hand_pose) 
+            for hand_pose in pose_filter.filter(iter_accepted_combinations(multi_link_combo, simple_link_combo))]
+
+def compute_accepted_combinations(multi_link_combo, simple_link_combo) :
+    # Compute all possible combinations of finger other than the thumb and status
+    print("\n\nCompute all possible combinations\n")
+    # The thumb is only in the opened state except for the case where every finger is down
+    return list(iter_accepted_combinations(multi_link_combo, simple_link_combo))
 
 ######################################################################################################################
 
@@ -197,26 +338,83 @@ class LayerRef(object):
     def has_valid_export_spec(self):
         return len(self.export_specs) > 0
 
-class ComboExport(inkex.Effect):
-    """The core logic of exporting combinations of layers as images."""
+class HandPoseExporter(object):
+    """The core logic of exporting combinations of layers as images. It only depends on lxml, the Inkscape extension
+       being the thin ComboExport adapter of export_hand_poses_effect.py.
+    """
 
     def __init__(self):
         super().__init__()
-        self.arg_parser.add_argument("--path", type=str, dest="path", default="~/", help="The directory to export into")
-        self.arg_parser.add_argument('-f', '--filetype', type=str, dest='filetype', default='jpeg', 
-                                     help='Exported file type. One of [png|jpeg]')
-        self.arg_parser.add_argument("--dpi", type=float, dest="dpi", default=90.0, help="DPI of exported image")
-        self.arg_parser.add_argument("--ascii", type=inkex.Boolean, dest="ascii", default=False, 
-                                     help="If true, removes non-ascii characters from layer names during export")
-        self.arg_parser.add_argument("--lower", type=inkex.Boolean, dest="lower", default=False, 
-                                     help="If true, foces the final file name to be lowercase")
-        self.arg_parser.add_argument("--multi", type=inkex.Boolean, dest="multi", default=False, 
-                                     help="Includes hand poses with 3 or more fingers linked")
-        self.arg_parser.add_argument("--simple", type=inkex.Boolean, dest="simple", default=False, 
-                                     help="Includes hand poses with 2 fingers linked")
-        self.arg_parser.add_argument("--debug", type=inkex.Boolean, dest="debug", default=False, help="Print debug messages as warnings")
-        self.arg_parser.add_argument("--five", type=inkex.Boolean, dest="five", default=False, help='Stop after processing five combination')
-        self.arg_parser.add_argument("--dry", type=inkex.Boolean, dest="dry", default=False, help="Don't actually do all of the exports")
+        self.renderer = None
+        self.manifest = None
+        self.instrumentation = Instrumentation()
+        self.view = None
+        self.show_hide_table = None
+        self.Image = None
+        self.sink = None
+        self.hand_poses = dict()
+        self.duplicates = dict()
+        self.layer_template = None
+        self.layer_template_lock = threading.Lock()
+
+    def add_arguments(self, pars):
+        pars.add_argument("--path", type=str, dest="path", default="~/", help="The directory to export into")
+        pars.add_argument('-f', '--filetype', type=str, dest='filetype', default='jpeg', 
+                          help='Exported file type. One of [png|jpeg]')
+        pars.add_argument("--dpi", type=dpi_list_arg, dest="dpi", default=[90.0], 
+                          help="DPI of exported image. Several comma separated DPIs export the hand poses at each " +
+                               "of them, into subdirectories named after the DPIs")
+        pars.add_argument("--quality", type=int, dest="quality", default=92, help="Quality of the JPEG images, 1 to 100")
+        pars.add_argument("--ascii", type=boolean_arg, dest="ascii", default=False, 
+                          help="If true, removes non-ascii characters from layer names during export")
+        pars.add_argument("--lower", type=boolean_arg, dest="lower", default=False, 
+                          help="If true, foces the final file name to be lowercase")
+        pars.add_argument("--multi", type=boolean_arg, dest="multi", default=False, 
+                          help="Includes hand poses with 3 or more fingers linked")
+        pars.add_argument("--simple", type=boolean_arg, dest="simple", default=False, 
+                          help="Includes hand poses with 2 fingers linked")
+        pars.add_argument("--debug", type=boolean_arg, dest="debug", default=False, help="Print debug messages as warnings")
+        pars.add_argument("--five", type=boolean_arg, dest="five", default=False, help='Stop after processing five combination')
+        pars.add_argument("--dry", type=boolean_arg, dest="dry", default=False, help="Don't actually do all of the exports")
+        pars.add_argument("--select", type=pose_selection_arg, action="append", dest="select", default=[], 
+                          help="Only exports the hand poses matching the selection, such as 'index=up,middle=*' " +
+                               "or 'thumb=up,index=up|down;pinky!=down'. May be given several times")
+        pars.add_argument("--labels", type=str, dest="labels", default="", 
+                          help="Only exports the hand poses with the given comma separated labels")
+        pars.add_argument("--labels-file", type=str, dest="labels_file", default="", 
+                          help="Only exports the hand poses whose labels are listed in the file, one per line")
+        pars.add_argument("--list", type=boolean_arg, dest="list", default=False, 
+                          help="If true, prints the selected hand poses and their exported files instead of exporting")
+        pars.add_argument("--jobs", type=int, dest="jobs", default=0, 
+                          help="Number of hand poses exported in parallel (0 uses the number of cores)")
+        pars.add_argument("--renderer", type=str, dest="renderer", default="cli", 
+                          help="How the hand poses are rendered. One of [cli|shell|cairosvg|stub], 'cli' starts " +
+                               "one inkscape process per pose, 'shell' keeps inkscape shells open for the whole run, " +
+                               "'cairosvg' renders with CairoSVG in a process pool and 'stub' writes blank images")
+        pars.add_argument("--duplicates", type=str, dest="duplicates", default="link", 
+                          help="How the hand poses showing the same layers as another one are exported. One of " +
+                               "[link|copy|render], 'link' hard links the file of the first one, falling back to a " +
+                               "copy, 'copy' copies it and 'render' renders every hand pose")
+        pars.add_argument("--prune", type=boolean_arg, dest="prune", default=False, 
+                          help="If true, removes the hidden layers, the unused definitions and the editor data " +
+                               "from the SVG of each hand pose before rendering it")
+        pars.add_argument("--composite", type=boolean_arg, dest="composite", default=False, 
+                          help="If true, renders each layer once and composites the hand poses from " +
+                               "these renders instead of rendering every hand pose (requires numpy and Pillow)")
+        pars.add_argument("--output-format", "--output_format", type=str, dest="output_format", default="files", 
+                          help="How the hand poses are written. One of [files|zip|npy|atlas], 'files' writes one " +
+                               "image per pose, 'zip' and 'npy' stream them into shards described by an index.json " +
+                               "file and 'atlas' packs them into sprite sheets described by an atlas.json file")
+        pars.add_argument("--shard-size", "--shard_size", type=int, dest="shard_size", default=256, 
+                          help="Number of hand poses per shard with the 'zip' and 'npy' output formats")
+        pars.add_argument("--atlas-size", "--atlas_size", type=int, dest="atlas_size", default=4096, 
+                          help="Maximum width and height of the sprite sheets of the 'atlas' output format")
+        pars.add_argument("--events", type=str, dest="events", default="", 
+                          help="JSON lines file receiving the timing of every stage of every hand pose export")
+        pars.add_argument("--stats", type=boolean_arg, dest="stats", default=False, 
+                          help="If true, prints the timing percentiles of each stage at the end of the run")
+        pars.add_argument("--force", type=boolean_arg, dest="force", default=False, 
+                          help="If true, exports every hand pose even if its exported file is up to date")
 
     def get_exported_layers(self, logit) :
         layers = self.get_layers(logit)
@@ -236,68 +434,472 @@ class ComboExport(inkex.Effect):
         return exported_layers
     
     def get_label_from_hand_pose(self, hand_pose):
-        # Has as input a hand pose of the form [(finger, status), (finger, status), ...]
-        # Returns a string of the form "finger1_status1_finger2_status2_..."
-        label = ""
-        for finger, status in hand_pose:
-            label = label+"_"+finger.capitalize()+"_"+status.capitalize()
-        return label[1:]
-
-    def effect(self):
+        return label_hand_pose(hand_pose)
+
+    def get_pose_filter(self):
+        """Returns the PoseFilter of the --select, --labels and --labels-file options."""
+        labels = [label.strip() for label in self.options.labels.split(",") if label.strip()]
+        if self.options.labels_file:
+            with open(os.path.expanduser(self.options.labels_file), "r") as labels_file:
+                labels.extend(line.strip() for line in labels_file if line.strip() and not line.startswith("#"))
+        return PoseFilter(self.options.select, labels)
+
+    def iter_hand_poses(self, logit):
+        """Lazily yields the accepted hand poses selected by the options."""
+        pose_filter = self.get_pose_filter()
+        yield from pose_filter.filter(iter_accepted_combinations(self.options.multi, self.options.simple))
+        if pose_filter.unmatched_labels():
+            logging.warning(f"No hand pose has the labels {pose_filter.unmatched_labels()}")
+
+    def list_hand_poses(self):
+        """Returns the label and the exported files of each selected hand pose, without reading the document."""
+        logit = logging.warning if self.options.debug else logging.info
+        output_path = os.path.expanduser(self.options.path)
+        listed = list()
+        for hand_pose in self.iter_hand_poses(logit):
+            label = self.get_label_from_hand_pose(hand_pose)
+            if self.options.output_format == "files":
+                files = [os.path.join(output_path, file_name) for file_name in self.get_file_names(label)]
+            else:
+                # The other formats write the hand poses into files described by an index.
+                index = AtlasSink.INDEX_FILE_NAME if self.options.output_format == "atlas" else \
+                        ShardSink.INDEX_FILE_NAME
+                dpis = self.options.dpi if len(self.options.dpi) > 1 else [None]
+                files = [os.path.join(output_path, format_dpi(dpi) if dpi else "", index) for dpi in dpis]
+            listed.append((label, files))
+        return listed
+
+    def get_render_dpi(self):
+        """Returns the DPI at which the hand poses are rendered, the highest one, the others being downsampled."""
+        return self.options.dpi[0]
+
+    def get_jobs(self):
+        if self.options.jobs > 0:
+            return self.options.jobs
+        return os.cpu_count() or 1
+
+    def export(self):
+        logit = logging.warning if self.options.debug else logging.info
+        logit(f"Options: {str(self.options)}")
+    
+        # The hand poses are generated lazily so that the first exports start right away
+        hand_poses = self.iter_hand_poses(logit)
+        
+        errors = dict()
+        with self.instrument(logit):
+            with ExportWorkers(self.get_jobs(), self.options.renderer, logit) as workers:
+                futures = self.submit_exports(hand_poses, workers, logit)
+                total = self.collect_exports(futures, errors)
+        
+        if errors:
+            self.report_errors(errors, total)
+    
+    def batch_export(self, sources: list):
+        """Exports the hand poses of several documents into subdirectories of --path named after them. The hand poses
+           are computed once and the renders of every document are scheduled on the same workers.
+        """
         logit = logging.warning if self.options.debug else logging.info
         logit(f"Options: {str(self.options)}")
+        
+        hand_poses = list(self.iter_hand_poses(logit))
+        errors = dict()
+        total = 0
+        with self.instrument(logit), ExportWorkers(self.get_jobs(), self.options.renderer, logit) as workers:
+            views = list()
+            for svg_path in find_svg_files(sources):
+                name = os.path.splitext(os.path.basename(svg_path))[0]
+                logit(f"Exporting '{svg_path}' into the '{name}' subdirectory")
+                view = self.get_view(name)
+                view.instrumentation = self.instrumentation
+                view.view = name
+                try:
+                    view.document = load_svg(svg_path)
+                    views.append((name, view, view.submit_exports(hand_poses, workers, logit)))
+                except Exception as error:
+                    errors[name] = error
+            
+            for name, view, futures in views:
+                view_errors = dict()
+                total += view.collect_exports(futures, view_errors)
+                for label, error in view_errors.items():
+                    errors[f"{name}/{label}"] = error
+        
+        if errors:
+            self.report_errors(errors, total)
+    
+    def get_view(self, name: str):
+        """Returns an exporter with the same options, exporting into the `name` subdirectory of --path."""
+        view = HandPoseExporter()
+        view.options = copy.copy(self.options)
+        view.options.path = os.path.join(os.path.expanduser(self.options.path), name)
+        return view
+    
+    def batch_list(self, sources: list):
+        """Returns the label and the exported files of each selected hand pose of each document, as batch_export 
+           would export them.
+        """
+        listed = list()
+        for svg_path in find_svg_files(sources):
+            name = os.path.splitext(os.path.basename(svg_path))[0]
+            listed.extend((f"{name}/{label}", files) for label, files in self.get_view(name).list_hand_poses())
+        return listed
+    
+    @contextlib.contextmanager
+    def instrument(self, logit):
+        """Times the whole run, writing the stage events to --events and summarizing them at the end."""
+        self.instrumentation = Instrumentation(self.options.events)
+        try:
+            with self.instrumentation.stage("run"):
+                yield self.instrumentation
+        finally:
+            self.instrumentation.close()
+            summary = self.instrumentation.summary()
+            logit(summary)
+            if self.options.stats:
+                print(summary, file=sys.stderr)
     
+    def submit_exports(self, hand_poses, workers, logit):
+        """Submits the exports of the hand poses of the document to the workers and returns the label of each 
+           future export. A document without any exported layer is skipped with a warning, while one whose exported
+           layers miss some fingers raises a RuntimeError naming them.
+        """
+        # Every pose is written to its own file named after its label, so the workers
+        # can render them in any order while keeping the output deterministic.
+        self.renderer = workers.renderer
+        if len(self.options.dpi) > 1:
+            self.Image = import_imaging_module()
+            if self.Image is None:
+                raise RuntimeError("Exporting several DPIs requires Pillow to be installed")
+        elif self.options.filetype == "jpeg" and not self.options.composite:
+            self.Image = import_imaging_module()
+            if self.Image is None:
+                logit("Pillow is not installed, the JPEG images are converted with ImageMagick's convert")
         layers = self.get_exported_layers(logit)
-        hand_poses = compute_accepted_combinations(self.options.multi, self.options.simple)
+        if not layers:
+            logging.warning(f"Skipping {repr(self.view) if self.view else 'the document'}: no layer has an " +
+                            "export-hand-poses attribute")
+            return dict()
+        missing = [finger for finger in FINGERS if finger not in layers]
+        if missing:
+            raise RuntimeError(f"no layer has an export-hand-poses attribute for the fingers {missing}")
+        # The shards are written again on every run, so they do not use the manifest.
+        if not self.options.dry and self.options.output_format == "files":
+            self.manifest = ExportManifest(self.get_output_path(logit), PoseHasher(self.document, layers), logit)
+        elif not self.options.dry:
+            self.sink = self.open_sink(logit)
         
+        exports = self.iter_shown_layers(hand_poses, layers, logit)
+        if self.options.duplicates != "render":
+            exports = self.iter_distinct_exports(exports, logit)
+        if self.options.composite:
+            return self.submit_composited_hand_poses(list(exports), layers, workers, logit)
+        futures = dict()
+        for label, show, hide in exports:
+            futures[workers.submit(self.export_pose, label, show, hide, logit)] = label
+        return futures
+    
+    def export_pose(self, label, show, hide, logit):
+        with self.instrumentation.stage("pose", label=label, view=self.view):
+            self.export_shown_layers(label, show, hide, logit)
+    
+    def iter_distinct_exports(self, exports, logit):
+        """Yields the exports whose visible layers differ from those of every previous export. The others are
+           remembered as duplicates of the first export showing the same layers, to be copied from it once exported.
+        """
+        self.duplicates = dict()
+        firsts = dict()
+        for label, show, hide in exports:
+            hidden = frozenset(hide)
+            signature = (frozenset(id for id in show if id not in hidden), hidden)
+            if signature in firsts:
+                logit(f"'{label}' shows the same layers as '{firsts[signature]}'")
+                self.duplicates[firsts[signature]].append(label)
+                continue
+            firsts[signature] = label
+            self.duplicates[label] = list()
+            yield label, show, hide
+    
+    def export_duplicate(self, label, duplicate, logit):
+        """Exports a duplicate hand pose from the exported files of the hand pose showing the same layers."""
+        with self.instrumentation.stage("duplicate", label=duplicate, view=self.view):
+            if self.sink is not None:
+                self.sink.alias(duplicate, self.hand_poses[duplicate], label)
+                return
+            for dpi in self.options.dpi:
+                output_path = self.get_output_path(logit, dpi)
+                source = os.path.join(output_path, self.get_file_name(label))
+                destination = os.path.join(output_path, self.get_file_name(duplicate))
+                logit(f"Writing '{duplicate}' as a {self.options.duplicates} of {source}")
+                link_or_copy(source, destination, self.options.duplicates == "link")
+    
+    def collect_exports(self, futures, errors):
+        """Waits for the exports, stores their errors by label, updates the manifest and returns the number of exports."""
+        logit = logging.warning if self.options.debug else logging.info
+        total = len(futures)
+        try:
+            for future in concurrent.futures.as_completed(futures):
+                label = futures[future]
+                try:
+                    future.result()
+                    if self.manifest is not None:
+                        self.manifest.record(label)
+                except Exception as error:
+                    errors[label] = error
+                    for duplicate in self.duplicates.get(label, []):
+                        errors[duplicate] = error
+                    continue
+                for duplicate in self.duplicates.get(label, []):
+                    try:
+                        self.export_duplicate(label, duplicate, logit)
+                        if self.manifest is not None:
+                            self.manifest.record(duplicate)
+                    except Exception as error:
+                        errors[duplicate] = error
+            saved = sum(len(duplicates) for duplicates in self.duplicates.values())
+            total += saved
+            if saved:
+                # Logged as a warning so that it is shown by default, as the summary of the run.
+                logging.warning(f"{saved} hand poses show the same layers as another one, {saved} renders were saved")
+        finally:
+            if self.sink is not None:
+                self.sink.close()
+                self.sink = None
+            if self.manifest is not None:
+                self.manifest.prune([self.get_label_from_hand_pose(hand_pose) for hand_pose in 
+                                     iter_accepted_combinations(self.options.multi, self.options.simple)])
+                self.manifest.save()
+        return total
+    
+    def iter_shown_layers(self, hand_poses, layers, logit):
+        """Yields the label and the layers to show and hide of each hand pose to export. The hand poses whose
+           exported file is up to date according to the manifest are skipped, unless --force was specified.
+        """
         count=1  # ounter to break on 5 first outputs
+        table = self.get_show_hide_table(layers)
         for hand_pose in hand_poses:
             show, hide = [], []
             for finger, status in hand_pose :
-                new_show, new_hide = self.update_show_hide(finger, status, layers, logit)
+                new_show, new_hide = table.lookup(finger, status)
                 show.extend(new_show)
                 hide.extend(new_hide)
             if self.options.dry:
                 logit(f"Skipping because --dry was specified")
                 continue
             label = self.get_label_from_hand_pose(hand_pose)
-            self.export_shown_layers(label, show, hide, logit)
+            self.hand_poses[label] = hand_pose
+            if self.manifest is not None and not self.manifest.expect(label, self.get_file_names(label), show, hide, self.get_render_settings()):
+                if not self.options.force:
+                    logit(f"Skipping '{label}' because its exported file is up to date")
+                    continue
+            yield label, show, hide
             # Break on 5 first outputs for debug purposes
             if self.options.five and count==5:
                 break
             count+=1
     
+    def submit_composited_hand_poses(self, exports, layers, workers, logit):
+        """Renders the untagged content and each tagged layer once, then submits the compositing of every hand pose
+           from these renders. Like `submit_exports`, returns the label of each future export.
+        """
+        if not exports:
+            return dict()
+        numpy, Image = import_compositing_modules()
+        exported_ids = [spec.layer.id for specs in layers.values() for spec in specs]
+        # Layers are composited in document order, which is the order in which they are painted.
+        ordered_ids = [element.get("id") for element in self.document.getroot().iter() 
+                       if element.get("id") in exported_ids]
+        ordered_ids = list(dict.fromkeys(ordered_ids))
+        
+        with tempfile.TemporaryDirectory() as render_dir:
+            base_path = os.path.join(render_dir, "base.png")
+            layer_paths = {id: os.path.join(render_dir, f"layer_{index}.png") for index, id in enumerate(ordered_ids)}
+            # Layer renders are not counted as hand poses in the stage summary
+            renders = [workers.submit(self.render_layers, base_path, [], ordered_ids, False)]
+            for id in ordered_ids:
+                renders.append(workers.submit(self.render_layers, layer_paths[id], [id], ordered_ids, True))
+            for render in renders:
+                render.result()
+            compositor = LayerCompositor(base_path, [(id, layer_paths[id]) for id in ordered_ids], numpy, Image)
+        
+        futures = dict()
+        for label, show, hide in exports:
+            futures[workers.submit(self.export_composited, label, show, hide, compositor, logit)] = label
+        return futures
+    
+    def export_composited(self, label, show, hide, compositor, logit):
+        with self.instrumentation.stage("pose", label=label, view=self.view):
+            with self.instrumentation.stage("composite"):
+                canvas = compositor.composite(show, hide)
+            with self.instrumentation.stage("save") as event:
+                event["bytes"] = self.save_composited(label, canvas, compositor.numpy, compositor.Image, logit)
+    
+    def render_layers(self, dest: str, show: list, exported_ids: list, transparent: bool):
+        """Renders a document with only the given tagged layers. If `transparent`, the untagged content and the
+           page background are hidden as well, so that the render can be composited over other ones.
+        """
+        doc = copy.deepcopy(self.document)
+        root = doc.getroot()
+        # The shown layers have to be painted along with their ancestors.
+        keep = set()
+        for element in root.iter():
+            if element.get("id") in show:
+                keep.update(element.iterancestors())
+                keep.add(element)
+        for element in root.iter():
+            if element.get("id") in exported_ids:
+                element.attrib['style'] = 'display:inline' if element in keep else 'display:none'
+        if transparent:
+            for ancestor in keep:
+                for sibling in ancestor.itersiblings(preceding=True):
+                    hide_drawing(sibling, keep)
+                for sibling in ancestor.itersiblings():
+                    hide_drawing(sibling, keep)
+            for namedview in root.iterfind("sodipodi:namedview", namespaces=NSS):
+                namedview.set("{%s}pageopacity" % NSS["inkscape"], "0")
+        with self.instrumentation.stage("layer", label=show[0] if show else "base", view=self.view):
+            with tempfile.TemporaryDirectory() as svg_dir:
+                svg_path = os.path.join(svg_dir, "layers.svg")
+                doc.write(svg_path)
+                self.export_to_png(svg_path, dest)
+    
+    def save_composited(self, label, canvas, numpy, Image, logit):
+        image = Image.fromarray(LayerBuffer.to_rgba(canvas, numpy), "RGBA")
+        if self.sink is not None:
+            buffer = io.BytesIO()
+            image.save(buffer, "PNG")
+            self.sink.add(label, self.hand_poses[label], buffer.getvalue())
+            return buffer.tell()
+        return self.save_resolutions(label, image, Image, logit)
+    
+    def save_resolutions(self, label, image, Image, logit):
+        """Writes the image, rendered at the highest DPI, at every DPI. Returns the number of bytes written."""
+        written = 0
+        for dpi, resized in iter_resolutions(image, self.options.dpi, Image):
+            output_path = self.get_output_path(logit, dpi)
+            if self.options.filetype == "jpeg":
+                layer_dest_jpg_path = os.path.join(output_path, f"{self.get_file_label(label)}.jpg")
+                logit(f"Writing JPEG to final location {layer_dest_jpg_path}")
+                jpeg = encode_jpeg(resized, Image, self.options.quality)
+                with replacing_file(layer_dest_jpg_path) as temporary_path, open(temporary_path, "wb") as jpeg_file:
+                    jpeg_file.write(jpeg)
+                written += len(jpeg)
+            else:
+                layer_dest_png_path = os.path.join(output_path, f"{self.get_file_label(label)}.png")
+                logit(f"Writing PNG to final location {layer_dest_png_path}")
+                with replacing_file(layer_dest_png_path) as temporary_path:
+                    resized.save(temporary_path, "PNG")
+                written += os.path.getsize(layer_dest_png_path)
+        return written
+    
+    @staticmethod
+    def report_errors(errors, total):
+        """Gathers the errors raised by the workers into a single report, sorted by label."""
+        report = f"{len(errors)} of {total} hand poses failed to export:"
+        for label in sorted(errors):
+            report += f"\n - {label}: {errors[label]}"
+        logging.error(report)
+        raise RuntimeError(report)
+    
     def update_show_hide(self, finger, status, layers, logit) :
         logit(f"Update show hide (finger, status) : ({finger}, {status})")
-        show = list()
-        hide = list()
-        
-        # Get layer corresponding to finger and status in layers
-        finger_layer = layers[finger]
-        for finger_with_status in finger_layer :
-            if finger_with_status.status == status :
-                show.append(finger_with_status.layer.id)
-            else :
-                hide.append(finger_with_status.layer.id)
-        return show, hide
+        return self.get_show_hide_table(layers).lookup(finger, status)
     
-    def export_shown_layers(self, label, show, hide, logit):
+    def get_show_hide_table(self, layers):
+        """Returns the ShowHideTable of the exported layers, built once for a given `layers` dictionary."""
+        if self.show_hide_table is None or self.show_hide_table.layers is not layers:
+            self.show_hide_table = ShowHideTable(layers)
+        return self.show_hide_table
+    
+    def get_file_label(self, label):
         label = f"{label}"
         if self.options.ascii:
             label = label.encode("ascii", "ignore").decode()
         if self.options.lower:
             label = label.lower()
-            
-        # Actually do the export into the destination path.
+        return label
+    
+    def get_file_name(self, label):
+        extension = "jpg" if self.options.filetype == "jpeg" else "png"
+        return f"{self.get_file_label(label)}.{extension}"
+    
+    def get_file_names(self, label):
+        """Returns the files exported for the hand pose, relative to the export directory: one per DPI."""
+        if len(self.options.dpi) == 1:
+            return [self.get_file_name(label)]
+        return [os.path.join(format_dpi(dpi), self.get_file_name(label)) for dpi in self.options.dpi]
+    
+    def open_sink(self, logit):
+        """Returns the sink of the --output-format option, which should not be 'files'. With several DPIs, each DPI 
+           gets its own sink in its subdirectory.
+        """
+        Image = import_imaging_module()
+        needs_pillow = self.options.output_format != "zip" or self.options.filetype == "jpeg"
+        if Image is None and (needs_pillow or len(self.options.dpi) > 1):
+            raise RuntimeError(f"The '{self.options.output_format}' output format of {self.options.filetype} " +
+                               "images requires Pillow to be installed")
+        if len(self.options.dpi) == 1:
+            return self.open_resolution_sink(self.get_output_path(logit), Image, logit)
+        sinks = [(dpi, self.open_resolution_sink(self.get_output_path(logit, dpi), Image, logit)) 
+                 for dpi in self.options.dpi]
+        return MultiResolutionSink(sinks, Image)
+    
+    def open_resolution_sink(self, output_path, Image, logit):
+        if self.options.output_format == "zip":
+            return ZipShardSink(output_path, self.options.shard_size, self.options.filetype, self.options.quality, 
+                                Image, self.get_file_name, logit)
+        if self.options.output_format == "npy":
+            return NpyShardSink(output_path, self.options.shard_size, Image, logit)
+        if self.options.output_format == "atlas":
+            return AtlasSink(output_path, self.options.atlas_size, Image, logit)
+        raise RuntimeError(f"Unknown output format '{self.options.output_format}', expected one of " +
+                           "[files|zip|npy|atlas]")
+    
+    def get_render_settings(self):
+        """Returns the options which change the rendered pixels, as hashed in the manifest."""
+        dpi = self.options.dpi[0] if len(self.options.dpi) == 1 else self.options.dpi
+        # The renderers do not give the same pixels, CairoSVG for instance ignores the page color.
+        settings = {"dpi": dpi, "filetype": self.options.filetype, "composite": self.options.composite, 
+                    "renderer": self.options.renderer}
+        if self.options.filetype == "jpeg":
+            settings["quality"] = self.options.quality
+        return settings
+    
+    def get_output_path(self, logit, dpi=None):
         output_path = os.path.expanduser(self.options.path)
         # Remove trailing slash for unix and windows
         if os.name == "nt":
             output_path = output_path.rstrip("\\")
         else :
             output_path = output_path.rstrip("/")
+        # Several DPIs are exported into subdirectories named after them.
+        if dpi is not None and len(self.options.dpi) > 1:
+            output_path = os.path.join(output_path, format_dpi(dpi))
         if not os.path.exists(os.path.join(output_path)):
             logit(f"Creating directory path {output_path} because it does not exist")
-            os.makedirs(os.path.join(output_path))
+            os.makedirs(os.path.join(output_path), exist_ok=True)
+        return output_path
+    
+    def export_shown_layers(self, label, show, hide, logit):
+        if self.sink is not None:
+            logit(f"Writing '{label}' to the shards")
+            self.sink.add(label, self.hand_poses[label], self.render_png(self.get_layers_svg(show, hide)))
+            return
+        if len(self.options.dpi) > 1:
+            png = self.render_png(self.get_layers_svg(show, hide))
+            with self.instrumentation.stage("resize") as event:
+                with self.Image.open(io.BytesIO(png)) as image:
+                    event["bytes"] = self.save_resolutions(label, image, self.Image, logit)
+            return
+        label = self.get_file_label(label)
+        # Actually do the export into the destination path.
+        output_path = self.get_output_path(logit)
+
+        # With Pillow, the PNG is encoded to JPEG in memory and only the JPEG is written.
+        if self.options.filetype == "jpeg" and self.Image is not None:
+            layer_dest_jpg_path = os.path.join(output_path, f"{label}.jpg")
+            logit(f"Writing JPEG to final location {layer_dest_jpg_path}")
+            self.export_jpeg(layer_dest_jpg_path, show, hide)
+            return
 
         # If OS is Windows, use a the CustomNamedTemporaryFile.
         if os.name == "nt":
@@ -336,67 +938,98 @@ class ComboExport(inkex.Effect):
                     self.export_to_png(layer_dest_svg_path, layer_dest_png_path)
                     
     def get_layers(self, logit) -> list:
-        svg_layers = self.document.xpath('//svg:g[@inkscape:groupmode="layer"]', namespaces=inkex.NSS)
+        svg_layers = self.document.xpath('//svg:g[@inkscape:groupmode="layer"]', namespaces=NSS)
         layers = []
+        layers_by_id = dict()
 
-        # Find all of our "valid" layers.
+        # Find all of our "valid" layers and create the layer hierarchy (children and parents) in the same pass. The
+        # layers come in document order, so the parent of a layer is always indexed before it.
         for layer in svg_layers:
             label_attrib_name = LayerRef.get_layer_attrib_name(layer)
             if label_attrib_name not in layer.attrib:
                 continue
-            layers.append(LayerRef(layer, logit))
-
-        # Create the layer hierarchy (children and parents).
-        for layer in layers:
-            for other in layers:
-                for child in layer.source.getchildren():
-                    if child is other.source:
-                        layer.children.append(other)
-                if layer.source.getparent() is other.source:
-                    layer.parent = other 
+            ref = LayerRef(layer, logit)
+            parent = layer.getparent()
+            other = layers_by_id.get(parent.get("id")) if parent is not None else None
+            if other is not None and other.source is parent:
+                ref.parent = other
+                other.children.append(ref)
+            layers_by_id[ref.id] = ref
+            layers.append(ref)
 
         return layers
 
+    def get_layer_template(self):
+        """Returns the document pre-serialized as a LayerTemplate, built on first use and shared by the workers."""
+        with self.layer_template_lock:
+            if self.layer_template is None and self.options.prune:
+                self.layer_template = PrunedLayerTemplate(self.document)
+            elif self.layer_template is None:
+                self.layer_template = LayerTemplate(self.document)
+            return self.layer_template
+
     def export_layers(self, dest: str, show: list, hide: list):
-        logit = logging.warning if self.options.debug else logging.info
-        doc = copy.deepcopy(self.document)
-        for layer in doc.xpath('//svg:g[@inkscape:groupmode="layer"]', namespaces=inkex.NSS):
-            id = layer.attrib["id"]
-            label_attrib_name = LayerRef.get_layer_attrib_name(layer)
-            label = layer.attrib[label_attrib_name]
+        svg = self.get_layers_svg(show, hide)
+        with open(dest, "wb") as svg_file:
+            svg_file.write(svg)
 
-            if id in show:
-                layer.attrib['style'] = 'display:inline'
-                # logit(f" ... showing layer '{label}'")
-            if id in hide:
-                layer.attrib['style'] = 'display:none'
-                # logit(f" ... hiding layer '{label}'")
-        doc.write(dest)
+    def get_layers_svg(self, show: list, hide: list) -> bytes:
+        with self.instrumentation.stage("svg") as event:
+            svg = self.get_layer_template().render(show, hide)
+            event["bytes"] = len(svg)
+        return svg
+
+    def export_jpeg(self, output_path: str, show: list, hide: list):
+        png = self.render_png(self.get_layers_svg(show, hide))
+        with self.instrumentation.stage("jpeg") as event:
+            with self.Image.open(io.BytesIO(png)) as image:
+                jpeg = encode_jpeg(image, self.Image, self.options.quality)
+            with replacing_file(output_path) as temporary_path, open(temporary_path, "wb") as jpeg_file:
+                jpeg_file.write(jpeg)
+            event["bytes"] = len(jpeg)
+
+    def render_png(self, svg: bytes) -> bytes:
+        """Renders the SVG and returns the PNG, without going through files if the renderer allows it."""
+        with self.instrumentation.stage("render") as event:
+            png, exit_code = self.get_renderer().render_bytes(svg, self.get_render_dpi())
+            if exit_code is not None:
+                event["exit_code"] = exit_code
+            event["bytes"] = len(png)
+        return png
 
     def export_to_png(self, svg_path: str, output_path: str):
-        logit = logging.warning if self.options.debug else logging.info
-        command = f"inkscape --export-type=\"png\" -d {self.options.dpi} --export-filename=\"{output_path}\" \"{svg_path}\""
-        # logit(f"Running command '{command}'")
-       
-        if os.name == "nt":
-            p = subprocess.Popen(command, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        else :
-            p = subprocess.Popen(command.encode("utf-8"), shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        p.wait()
-        output, err = p.communicate()
-        logit(f"stdout:\n{output}")
-        logit(f"stderr:\n{err}")
+        with self.instrumentation.stage("render") as event:
+            with replacing_file(output_path) as temporary_path:
+                exit_code = self.get_renderer().render_file(svg_path, temporary_path, self.get_render_dpi())
+            if exit_code is not None:
+                event["exit_code"] = exit_code
+            event["bytes"] = os.path.getsize(output_path)
+
+    def get_renderer(self):
+        """Returns the renderer of the workers, or an inkscape process per render outside of them."""
+        if self.renderer is None:
+            logit = logging.warning if self.options.debug else logging.info
+            self.renderer = InkscapeCliRenderer(1, logit)
+        return self.renderer
 
     def convert_png_to_jpeg(self, png_path: str, output_path: str):
+        with self.instrumentation.stage("jpeg") as event:
+            with replacing_file(output_path) as temporary_path:
+                event["exit_code"] = self.run_convert(png_path, temporary_path)
+            event["bytes"] = os.path.getsize(output_path)
+
+    def run_convert(self, png_path: str, output_path: str):
         logit = logging.warning if self.options.debug else logging.info
         command = f"convert \"{png_path}\" \"{output_path}\""
         # logit(f"Running command '{command}'")
 
         p = subprocess.Popen(command.encode("utf-8"), shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        p.wait()
         output, err = p.communicate()
         logit(f"stdout:\n{output}")
         logit(f"stderr:\n{err}")
+        if p.returncode != 0:
+            raise RuntimeError(f"convert exited with code {p.returncode} while exporting '{output_path}': {err}")
+        return p.returncode
 
 #######################################################################################################################
 
@@ -427,6 +1060,1161 @@ class CustomNamedTemporaryFile:
         if self._delete:
             os.remove(self._tempFile.name)
 
+class InkscapeShell:
+    """A long-lived `inkscape --shell` session that is fed with export actions, so that the inkscape startup
+       cost is paid once per session instead of once per hand pose.
+    """
+
+    PROMPT = b"> "
+    # Seconds after which a shell which did not answer a command is considered hung, and killed.
+    TIMEOUT = 120
+
+    def __init__(self, logit):
+        self.logit = logit
+        self.process = None
+
+    def is_alive(self):
+        return self.process is not None and self.process.poll() is None
+
+    def start(self):
+        self.logit("Starting an inkscape shell")
+        self.process = subprocess.Popen(["inkscape", "--shell"], stdin=subprocess.PIPE, stdout=subprocess.PIPE, 
+                                        stderr=subprocess.STDOUT)
+        self.read_until_prompt()
+
+    def read_until_prompt(self):
+        """Reads the shell output until it waits for the next command. An EOFError is raised if the shell died, and
+           a TimeoutError if it did not answer within TIMEOUT seconds, in which case it is killed. The shell is 
+           killed by a timer since, unlike sockets, pipes cannot be waited on with a timeout on Windows.
+        """
+        output = b""
+        timed_out = threading.Event()
+        def kill_hung_shell(process=self.process):
+            timed_out.set()
+            process.kill()
+        timer = threading.Timer(self.TIMEOUT, kill_hung_shell)
+        timer.start()
+        try:
+            while not output.endswith(self.PROMPT):
+                chunk = os.read(self.process.stdout.fileno(), 4096)
+                if not chunk:
+                    if timed_out.is_set():
+                        raise TimeoutError(f"inkscape shell did not answer within {self.TIMEOUT}s: {output}")
+                    raise EOFError(f"inkscape shell exited with code {self.process.wait()}: {output}")
+                output += chunk
+        finally:
+            timer.cancel()
+        return output[:-len(self.PROMPT)]
+
+    def run(self, actions: list):
+        self.process.stdin.write((";".join(actions) + "\n").encode("utf-8"))
+        self.process.stdin.flush()
+        return self.read_until_prompt()
+
+    def export_to_png(self, svg_path: str, output_path: str, dpi: float):
+        """Exports the SVG to a PNG, restarting the shell once if it crashed or hung before or while exporting."""
+        actions = [f"file-open:{svg_path}", "export-type:png", f"export-dpi:{dpi}", 
+                   f"export-filename:{output_path}", "export-do", "file-close"]
+        for attempt in range(2):
+            try:
+                if not self.is_alive():
+                    self.start()
+                output = self.run(actions)
+                break
+            except (EOFError, OSError) as error:
+                # TimeoutError is an OSError.
+                self.logit(f"inkscape shell failed while exporting '{output_path}': {error}")
+                self.kill()
+                if attempt == 1:
+                    raise RuntimeError(f"inkscape shell crashed twice while exporting '{output_path}': {error}")
+        self.logit(f"stdout:\n{output}")
+        if not os.path.exists(output_path) or os.path.getsize(output_path) == 0:
+            raise RuntimeError(f"inkscape shell did not export '{output_path}': {output}")
+
+    def kill(self):
+        if self.process is not None:
+            self.process.kill()
+            self.release()
+
+    def release(self):
+        self.process.wait()
+        self.process.stdin.close()
+        self.process.stdout.close()
+        self.process = None
+
+    def close(self):
+        if self.process is None:
+            return
+        try:
+            self.process.stdin.write(b"quit\n")
+            self.process.stdin.flush()
+            self.process.wait(timeout=10)
+            self.release()
+        except (OSError, subprocess.TimeoutExpired):
+            self.kill()
+
+class InkscapeShellPool:
+    """Hands out up to `size` inkscape shells to the export workers, one shell per worker at a time."""
+
+    def __init__(self, size: int, logit):
+        self.size = size
+        self.logit = logit
+        self.shells = list()
+        self.idle = queue.Queue()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        try:
+            return self.idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self.lock:
+            if len(self.shells) < self.size:
+                shell = InkscapeShell(self.logit)
+                self.shells.append(shell)
+                return shell
+        return self.idle.get()
+
+    def export_to_png(self, svg_path: str, output_path: str, dpi: float):
+        shell = self.acquire()
+        try:
+            shell.export_to_png(svg_path, output_path, dpi)
+        finally:
+            self.idle.put(shell)
+
+    def close(self):
+        for shell in self.shells:
+            shell.close()
+        self.shells = list()
+
+class Renderer(object):
+    """Renders the SVG of the hand poses to PNG images, for every export worker. A renderer implements at least one
+       of `render_file` and `render_bytes`, each defaulting to the other through temporary files.
+    """
+
+    def __init__(self, jobs: int, logit):
+        self.logit = logit
+
+    def render_file(self, svg_path: str, output_path: str, dpi: float):
+        """Renders the SVG file into the PNG file. Returns the exit code of the renderer process, or None."""
+        with open(svg_path, "rb") as svg_file:
+            png, exit_code = self.render_bytes(svg_file.read(), dpi)
+        with open(output_path, "wb") as png_file:
+            png_file.write(png)
+        return exit_code
+
+    def render_bytes(self, svg: bytes, dpi: float):
+        """Renders the SVG and returns the PNG along with the exit code of the renderer process, or None."""
+        with tempfile.TemporaryDirectory() as render_dir:
+            svg_path = os.path.join(render_dir, "pose.svg")
+            png_path = os.path.join(render_dir, "pose.png")
+            with open(svg_path, "wb") as svg_file:
+                svg_file.write(svg)
+            exit_code = self.render_file(svg_path, png_path, dpi)
+            with open(png_path, "rb") as png_file:
+                return png_file.read(), exit_code
+
+    def close(self):
+        pass
+
+class InkscapeCliRenderer(Renderer):
+    """Starts an inkscape process per render."""
+
+    def render_file(self, svg_path: str, output_path: str, dpi: float):
+        command = f"inkscape --export-type=\"png\" -d {dpi} --export-filename=\"{output_path}\" \"{svg_path}\""
+        # self.logit(f"Running command '{command}'")
+       
+        if os.name == "nt":
+            p = subprocess.Popen(command, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        else :
+            p = subprocess.Popen(command.encode("utf-8"), shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        output, err = p.communicate()
+        self.logit(f"stdout:\n{output}")
+        self.logit(f"stderr:\n{err}")
+        if p.returncode != 0:
+            raise RuntimeError(f"inkscape exited with code {p.returncode} while exporting '{output_path}': {err}")
+        return p.returncode
+
+    def render_bytes(self, svg: bytes, dpi: float):
+        """Pipes the SVG to inkscape, which writes the PNG to its output."""
+        command = ["inkscape", "--pipe", "--export-type=png", "-d", str(dpi), "--export-filename=-"]
+        p = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        png, err = p.communicate(svg)
+        self.logit(f"stderr:\n{err}")
+        if p.returncode != 0 or not png:
+            raise RuntimeError(f"inkscape exited with code {p.returncode} while rendering a PNG to its output: {err}")
+        return png, p.returncode
+
+class InkscapeShellRenderer(Renderer):
+    """Exports through an inkscape shell per worker, kept open for the whole run. The shells read and write files
+       only, as their output carries the prompt.
+    """
+
+    def __init__(self, jobs: int, logit):
+        super().__init__(jobs, logit)
+        self.pool = InkscapeShellPool(jobs, logit)
+
+    def render_file(self, svg_path: str, output_path: str, dpi: float):
+        self.pool.export_to_png(svg_path, output_path, dpi)
+        return None
+
+    def close(self):
+        self.pool.close()
+
+def render_with_cairosvg(svg: bytes, dpi: float) -> bytes:
+    import cairosvg
+    return cairosvg.svg2png(bytestring=svg, dpi=dpi)
+
+class CairoSvgRenderer(Renderer):
+    """Renders with CairoSVG, which does not need Inkscape. CairoSVG ignores the Inkscape page color, hence the 
+       background of the renders is transparent, and supports less of SVG than Inkscape. As CairoSVG parses and
+       walks the document in Python, the renders run in a pool of `jobs` processes rather than in the worker threads.
+    """
+
+    def __init__(self, jobs: int, logit):
+        super().__init__(jobs, logit)
+        try:
+            import cairosvg
+        except (ImportError, OSError) as error:
+            # OSError is raised when CairoSVG is installed without the cairo library.
+            raise RuntimeError(f"The 'cairosvg' renderer requires CairoSVG and the cairo library to be installed: {error}")
+        self.executor = concurrent.futures.ProcessPoolExecutor(max_workers=jobs) if jobs > 1 else None
+
+    def render_bytes(self, svg: bytes, dpi: float):
+        if self.executor is None:
+            return render_with_cairosvg(svg, dpi), None
+        return self.executor.submit(render_with_cairosvg, svg, dpi).result(), None
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
+
+class StubRenderer(Renderer):
+    """Writes a blank 1x1 image instead of rendering, to test and benchmark the rest of the export."""
+
+    def render_bytes(self, svg: bytes, dpi: float):
+        return BLANK_PNG, None
+
+RENDERERS = {"cli": InkscapeCliRenderer, 
+             "shell": InkscapeShellRenderer, 
+             "cairosvg": CairoSvgRenderer, 
+             "stub": StubRenderer}
+
+def create_renderer(name: str, jobs: int, logit) -> Renderer:
+    if name not in RENDERERS:
+        raise RuntimeError(f"Unknown renderer '{name}', expected one of [{'|'.join(RENDERERS)}]")
+    return RENDERERS[name](jobs, logit)
+
+def make_blank_png() -> bytes:
+    """Returns a valid 1x1 transparent PNG, built without any imaging library."""
+    def chunk(kind, data):
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data) & 0xffffffff)
+    header = struct.pack(">IIBBBBB", 1, 1, 8, 6, 0, 0, 0)
+    return b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", header) + chunk(b"IDAT", zlib.compress(b"\x00" * 5)) + \
+           chunk(b"IEND", b"")
+
+BLANK_PNG = make_blank_png()
+
+class LayerTemplate(object):
+    """The document serialized once, split around the style attribute of every layer. Exporting a hand pose then
+       only joins the chunks with the style of each layer, which gives the very same bytes as setting the styles on
+       a copy of the document and writing it, without copying or serializing the whole document for every pose.
+    """
+
+    PLACEHOLDER = "export-hand-poses-placeholder-{}"
+
+    def __init__(self, document):
+        doc = copy.deepcopy(document)
+        self.ids = list()
+        self.original_styles = list()
+        placeholders = list()
+        for layer in doc.xpath('//svg:g[@inkscape:groupmode="layer"]', namespaces=NSS):
+            style = layer.get("style")
+            # A layer without style gets one appended when shown or hidden, hence the whole attribute is templated.
+            self.original_styles.append(b"" if style is None else LayerTemplate.serialize_style(style))
+            placeholder = LayerTemplate.serialize_style(LayerTemplate.PLACEHOLDER.format(len(self.ids)))
+            placeholders.append(placeholder)
+            self.ids.append(layer.attrib["id"])
+            layer.attrib["style"] = LayerTemplate.PLACEHOLDER.format(len(self.ids) - 1)
+
+        serialized = etree.tostring(doc)
+        self.chunks = list()
+        for placeholder in placeholders:
+            chunk, serialized = serialized.split(placeholder, 1)
+            self.chunks.append(chunk)
+        self.chunks.append(serialized)
+        self.shown_style = LayerTemplate.serialize_style("display:inline")
+        self.hidden_style = LayerTemplate.serialize_style("display:none")
+
+    @staticmethod
+    def serialize_style(style: str) -> bytes:
+        """Returns the style attribute as serialized by lxml, including its leading space."""
+        return etree.tostring(etree.Element("g", style=style))[2:-2]
+
+    def render(self, show: list, hide: list) -> bytes:
+        show, hide = set(show), set(hide)
+        parts = [self.chunks[0]]
+        for index, id in enumerate(self.ids):
+            if id in hide:
+                parts.append(self.hidden_style)
+            elif id in show:
+                parts.append(self.shown_style)
+            else:
+                parts.append(self.original_styles[index])
+            parts.append(self.chunks[index + 1])
+        return b"".join(parts)
+
+class PrunedLayerTemplate(LayerTemplate):
+    """A LayerTemplate leaving out of each hand pose the subtrees of its hidden layers, be they hidden by the hand 
+       pose or by the document, the definitions which the rest of the document does not reference, and the guides,
+       grids and view settings of the named view. Hidden layers and definitions referenced by what remains, through
+       `url(#id)` or `href="#id"`, are kept, as well as the style sheets, scripts and fonts which apply to the whole
+       document. The renderer hence parses a smaller document which renders the same.
+
+       The removable subtrees are delimited by comments in the serialized document, which is split into tokens
+       once, so that a hand pose only skips the tokens between the comments of its removed subtrees.
+    """
+
+    MARKER = "export-hand-poses-segment-{}-{}"
+    TOKENS = re.compile(rb'<!--export-hand-poses-segment-(begin|end)-(\d+)-->|' + 
+                        rb' style="export-hand-poses-placeholder-(\d+)"')
+    REFERENCES = re.compile(r'url\(\s*[\'"]?#([^\s\'")]+)')
+    HIDDEN = re.compile(r'(^|;)\s*display\s*:\s*none\s*(;|$)')
+    KEPT = ["style", "script", "font"]
+    NAMEDVIEW_ATTRIBUTES = ["id", "pagecolor", "bordercolor", "borderopacity", "units", 
+                            "{%s}pageopacity" % NSS["inkscape"], "{%s}pagecheckerboard" % NSS["inkscape"],
+                            "{%s}document-units" % NSS["inkscape"]]
+
+    def __init__(self, document):
+        doc = copy.deepcopy(document)
+        root = doc.getroot()
+        PrunedLayerTemplate.strip_namedview(root)
+
+        # The removable subtrees are the layers, which are removed when hidden, and the definitions.
+        layers = root.xpath('//svg:g[@inkscape:groupmode="layer"]', namespaces=NSS)
+        segments = [(layer, layer.get("id")) for layer in layers]
+        for defs in root.iterfind(".//svg:defs", namespaces=NSS):
+            segments.extend((definition, None) for definition in defs if isinstance(definition.tag, str))
+        self.segment_ids = [id for _, id in segments]
+        self.index_references(root, [element for element, _ in segments])
+
+        self.ids = list()
+        self.original_styles = list()
+        self.hidden_ids = set()
+        for layer in layers:
+            style = layer.get("style")
+            self.original_styles.append(b"" if style is None else LayerTemplate.serialize_style(style))
+            if PrunedLayerTemplate.HIDDEN.search(style or "") or layer.get("display") == "none":
+                self.hidden_ids.add(layer.attrib["id"])
+            self.ids.append(layer.attrib["id"])
+            layer.attrib["style"] = LayerTemplate.PLACEHOLDER.format(len(self.ids) - 1)
+        for index, (element, _) in enumerate(segments):
+            end = etree.Comment(PrunedLayerTemplate.MARKER.format("end", index))
+            end.tail, element.tail = element.tail, None
+            element.addnext(end)
+            element.addprevious(etree.Comment(PrunedLayerTemplate.MARKER.format("begin", index)))
+
+        # The tokens are ("chunk", bytes), ("begin", segment), ("end", segment) or ("style", layer index).
+        self.tokens = list()
+        parts = PrunedLayerTemplate.TOKENS.split(etree.tostring(doc))
+        for index in range(0, len(parts), 4):
+            if parts[index]:
+                self.tokens.append(("chunk", parts[index]))
+            if index + 3 >= len(parts):
+                break
+            kind, segment, style = parts[index + 1:index + 4]
+            if style is not None:
+                self.tokens.append(("style", int(style)))
+            else:
+                self.tokens.append((kind.decode("ascii"), int(segment)))
+        self.shown_style = LayerTemplate.serialize_style("display:inline")
+        self.hidden_style = LayerTemplate.serialize_style("display:none")
+
+    @staticmethod
+    def strip_namedview(root):
+        """Removes the editor data of the named view, keeping the page color and opacity used as background by the
+           export as well as the pages of multi-page documents.
+        """
+        for namedview in root.iterfind("sodipodi:namedview", namespaces=NSS):
+            for name in list(namedview.attrib):
+                if name not in PrunedLayerTemplate.NAMEDVIEW_ATTRIBUTES:
+                    del namedview.attrib[name]
+            for child in list(namedview):
+                if child.tag != "{%s}page" % NSS["inkscape"]:
+                    namedview.remove(child)
+
+    @staticmethod
+    def get_references(element) -> set:
+        references = set()
+        for value in element.attrib.values():
+            references.update(PrunedLayerTemplate.REFERENCES.findall(value))
+            references.update(part.strip()[1:] for part in value.split(";") if part.strip().startswith("#"))
+        if etree.QName(element).localname in PrunedLayerTemplate.KEPT and element.text:
+            references.update(PrunedLayerTemplate.REFERENCES.findall(element.text))
+        return references
+
+    def index_references(self, root, segment_elements: list):
+        """Indexes, for each segment, its parent segments, the ids it defines and the ids it references, outside of
+           the segments nested in it. The content outside of every segment is never removed, nor are the segments
+           holding a style sheet, a script or a font, whose references are hence static as well.
+        """
+        segment_of = {element: index for index, element in enumerate(segment_elements)}
+        self.segment_ancestors = [list() for _ in segment_elements]
+        self.defined = [set() for _ in segment_elements]
+        self.references = [set() for _ in segment_elements]
+        self.static_references = set()
+        self.kept = set()
+        stack = [(root, None, [])]
+        while stack:
+            element, segment, ancestors = stack.pop()
+            if element in segment_of:
+                if segment is not None:
+                    ancestors = ancestors + [segment]
+                segment = segment_of[element]
+                self.segment_ancestors[segment] = ancestors
+            if isinstance(element.tag, str):
+                if segment is None or etree.QName(element).localname in PrunedLayerTemplate.KEPT:
+                    if segment is not None:
+                        self.kept.update(ancestors + [segment])
+                    self.static_references.update(PrunedLayerTemplate.get_references(element))
+                else:
+                    self.references[segment].update(PrunedLayerTemplate.get_references(element))
+                    if element.get("id") is not None:
+                        self.defined[segment].add(element.get("id"))
+            stack.extend((child, segment, ancestors) for child in element)
+
+    def get_removed_segments(self, hide: set) -> set:
+        """Returns the segments to remove: the hidden layers and the definitions, except those referenced by the
+           content which remains, along with their ancestors.
+        """
+        candidates = set(index for index, id in enumerate(self.segment_ids) 
+                         if (id is None or id in hide) and index not in self.kept)
+        while True:
+            removed = set(index for index in range(len(self.segment_ids)) 
+                          if index in candidates or any(ancestor in candidates 
+                                                        for ancestor in self.segment_ancestors[index]))
+            referenced = set(self.static_references)
+            for index in range(len(self.segment_ids)):
+                if index not in removed:
+                    referenced.update(self.references[index])
+            needed = [index for index in removed if not self.defined[index].isdisjoint(referenced)]
+            if not needed:
+                return removed
+            for index in needed:
+                candidates.discard(index)
+                candidates.difference_update(self.segment_ancestors[index])
+
+    def render(self, show: list, hide: list) -> bytes:
+        show, hide = set(show), set(hide)
+        # As in LayerTemplate.render, hiding a layer prevails over showing it.
+        removed = self.get_removed_segments(hide | (self.hidden_ids - show))
+        parts = list()
+        skipped = None
+        for kind, value in self.tokens:
+            if skipped is not None:
+                if kind == "end" and value == skipped:
+                    skipped = None
+            elif kind == "chunk":
+                parts.append(value)
+            elif kind == "style":
+                id = self.ids[value]
+                if id in hide:
+                    parts.append(self.hidden_style)
+                elif id in show:
+                    parts.append(self.shown_style)
+                else:
+                    parts.append(self.original_styles[value])
+            elif kind == "begin" and value in removed:
+                skipped = value
+        return b"".join(parts)
+
+class ShowHideTable(object):
+    """The ids of the layers to show and hide for every (finger, status) pair, computed once from the exported layers
+       so that the visibility of a hand pose is a lookup per finger. The ids are shared tuples, not to be modified.
+    """
+
+    def __init__(self, layers: dict):
+        self.layers = layers
+        self.table = dict()
+        self.hidden = dict()
+        for finger, specs in layers.items():
+            statuses = dict.fromkeys([spec.status for spec in specs])
+            self.table[finger] = {status: (tuple(spec.layer.id for spec in specs if spec.status == status),
+                                           tuple(spec.layer.id for spec in specs if spec.status != status))
+                                  for status in statuses}
+            # A status without layers shows none of the layers of the finger.
+            self.hidden[finger] = ((), tuple(spec.layer.id for spec in specs))
+
+    def lookup(self, finger: str, status: str) -> tuple:
+        """Returns the ids to show and to hide. Like the exported layers, raises a KeyError for an unknown finger."""
+        return self.table[finger].get(status) or self.hidden[finger]
+
+class ShardSink(object):
+    """Streams the hand poses into shards of `shard_size` poses as they are rendered, instead of one file per pose.
+       The index.json file written on close maps every hand pose, by label and by the status of each finger, to its 
+       shard and its position in it. Subclasses write the shards.
+    """
+
+    INDEX_FILE_NAME = "index.json"
+    VERSION = 1
+    FORMAT = None
+    EXTENSION = None
+
+    def __init__(self, output_path: str, shard_size: int, logit):
+        self.output_path = output_path
+        self.shard_size = max(1, shard_size)
+        self.logit = logit
+        self.lock = threading.Lock()
+        self.shards = list()
+        self.entries = list()
+        self.count = 0
+        # Shards left by a previous run would otherwise be mixed with the new ones.
+        for file_name in os.listdir(output_path):
+            if file_name.startswith("shard-") and file_name.endswith(f".{self.EXTENSION}"):
+                os.remove(os.path.join(output_path, file_name))
+
+    def add(self, label: str, hand_pose: list, png: bytes):
+        """Adds the PNG render of a hand pose to the current shard. Safe to call from several workers."""
+        data = self.prepare(png)
+        with self.lock:
+            if self.count % self.shard_size == 0:
+                if self.shards:
+                    self.close_shard()
+                self.shards.append(f"shard-{len(self.shards):05d}.{self.EXTENSION}")
+                self.open_shard(os.path.join(self.output_path, self.shards[-1]))
+            entry = {"label": label, 
+                     "pose": [[finger, status] for finger, status in hand_pose],
+                     "fingers": {finger: status for finger, status in hand_pose},
+                     "shard": len(self.shards) - 1}
+            entry.update(self.write(label, data))
+            self.entries.append(entry)
+            self.count += 1
+
+    def alias(self, label: str, hand_pose: list, original: str):
+        """Indexes a hand pose showing the same layers as an added one, pointing at the data of the latter."""
+        with self.lock:
+            entry = dict(next(entry for entry in self.entries if entry["label"] == original))
+            entry.update({"label": label, 
+                          "pose": [[finger, status] for finger, status in hand_pose],
+                          "fingers": {finger: status for finger, status in hand_pose},
+                          "alias": original})
+            self.entries.append(entry)
+
+    def close(self):
+        with self.lock:
+            if self.shards:
+                self.close_shard()
+            index = {"version": self.VERSION, "format": self.FORMAT, "shards": self.shards, "poses": self.entries}
+            index.update(self.describe())
+            index_path = os.path.join(self.output_path, self.INDEX_FILE_NAME)
+            with open(index_path + ".tmp", "w") as index_file:
+                json.dump(index, index_file, indent=1)
+            os.replace(index_path + ".tmp", index_path)
+            self.logit(f"Wrote {self.count} hand poses into {len(self.shards)} shards indexed by '{index_path}'")
+
+    def prepare(self, png: bytes):
+        """Turns the PNG into the data stored in the shards, outside of the lock."""
+        return png
+
+    def describe(self) -> dict:
+        """Returns the fields of the index describing the content of the shards."""
+        return dict()
+
+    def open_shard(self, path: str):
+        raise NotImplementedError()
+
+    def write(self, label: str, data) -> dict:
+        """Writes the data into the current shard and returns where, as fields of the index entry."""
+        raise NotImplementedError()
+
+    def close_shard(self):
+        raise NotImplementedError()
+
+class ZipShardSink(ShardSink):
+    """Stores the exported images as they are, in uncompressed zip archives since they are already compressed."""
+
+    FORMAT = "zip"
+    EXTENSION = "zip"
+
+    def __init__(self, output_path: str, shard_size: int, filetype: str, quality: int, Image, get_file_name, logit):
+        super().__init__(output_path, shard_size, logit)
+        self.filetype = filetype
+        self.quality = quality
+        self.Image = Image
+        self.get_file_name = get_file_name
+        self.archive = None
+
+    def prepare(self, png: bytes):
+        if self.filetype != "jpeg":
+            return png
+        with self.Image.open(io.BytesIO(png)) as image:
+            return encode_jpeg(image, self.Image, self.quality)
+
+    def open_shard(self, path: str):
+        self.archive = zipfile.ZipFile(path, "w", zipfile.ZIP_STORED)
+
+    def write(self, label: str, data) -> dict:
+        member = self.get_file_name(label)
+        self.archive.writestr(member, data)
+        return {"member": member}
+
+    def close_shard(self):
+        self.archive.close()
+        self.archive = None
+
+class NpyShardSink(ShardSink):
+    """Stores the decoded RGBA pixels in NumPy .npy files of shape (poses, height, width, 4), which can be memory 
+       mapped with `numpy.load(path, mmap_mode="r")`. Every hand pose of a view must have the same size.
+    """
+
+    FORMAT = "npy"
+    EXTENSION = "npy"
+    # The header is given a fixed size so that it can be rewritten with the final number of poses.
+    HEADER_SIZE = 128
+
+    def __init__(self, output_path: str, shard_size: int, Image, logit):
+        super().__init__(output_path, shard_size, logit)
+        self.Image = Image
+        self.size = None
+        self.array = None
+        self.rows = 0
+
+    def prepare(self, png: bytes):
+        with self.Image.open(io.BytesIO(png)) as image:
+            return image.size, image.convert("RGBA").tobytes()
+
+    def describe(self) -> dict:
+        if self.size is None:
+            return {"dtype": "uint8", "shape": None}
+        return {"dtype": "uint8", "shape": [self.size[1], self.size[0], 4]}
+
+    def header(self) -> bytes:
+        shape = (self.rows, self.size[1], self.size[0], 4) if self.size is not None else (0,)
+        header = "{'descr': '|u1', 'fortran_order': False, 'shape': %r, }" % (shape,)
+        header = header.ljust(self.HEADER_SIZE - 11) + "\n"
+        return b"\x93NUMPY\x01\x00" + struct.pack("<H", len(header)) + header.encode("latin1")
+
+    def open_shard(self, path: str):
+        self.array = open(path, "wb")
+        self.rows = 0
+        self.array.write(self.header())
+
+    def write(self, label: str, data) -> dict:
+        size, pixels = data
+        if self.size is None:
+            self.size = size
+        elif size != self.size:
+            raise RuntimeError(f"'{label}' is {size[0]}x{size[1]} while the previous hand poses are " +
+                               f"{self.size[0]}x{self.size[1]}, the npy output format needs them to be the same size")
+        self.array.write(pixels)
+        self.rows += 1
+        return {"row": self.rows - 1}
+
+    def close_shard(self):
+        self.array.seek(0)
+        self.array.write(self.header())
+        self.array.close()
+        self.array = None
+
+class AtlasSink(object):
+    """Packs the hand poses into a few PNG sprite sheets of at most `size` pixels per side, trimmed of their 
+       transparent borders. The atlas.json file maps every hand pose, by label and by the status of each finger, to 
+       its rectangle in a sheet, along with the offset of the trimmed image in the full render to place it back.
+    """
+
+    INDEX_FILE_NAME = "atlas.json"
+    VERSION = 1
+    # Transparent pixels between the sprites, so that filtering a sprite does not bleed its neighbours in.
+    PADDING = 1
+
+    def __init__(self, output_path: str, size: int, Image, logit):
+        self.output_path = output_path
+        self.size = size
+        self.Image = Image
+        self.logit = logit
+        self.lock = threading.Lock()
+        self.sprites = list()
+        self.aliases = list()
+        for file_name in os.listdir(output_path):
+            if file_name.startswith("atlas-") and file_name.endswith(".png"):
+                os.remove(os.path.join(output_path, file_name))
+
+    def add(self, label: str, hand_pose: list, png: bytes):
+        """Trims the PNG render of a hand pose and keeps it until the sheets are packed on close."""
+        with self.Image.open(io.BytesIO(png)) as image:
+            image = image.convert("RGBA")
+        box = image.getchannel("A").getbbox() or (0, 0, 0, 0)
+        sprite = {"label": label, "hand_pose": hand_pose, "image": image.crop(box), "box": box, "size": image.size}
+        with self.lock:
+            self.sprites.append(sprite)
+
+    def alias(self, label: str, hand_pose: list, original: str):
+        """Maps a hand pose showing the same layers as an added one to the sprite of the latter."""
+        with self.lock:
+            self.aliases.append((label, hand_pose, original))
+
+    def pack(self) -> list:
+        """Places the sprites on shelves, tallest first, starting a new sheet when one is full. Returns the size
+           of each sheet, sprites wider or taller than `size` getting a sheet of their own size.
+        """
+        sheets = list()
+        # The sheet which the shelves are filling, the oversized sprites being on sheets of their own.
+        current = None
+        x = y = shelf_height = 0
+        for sprite in sorted(self.sprites, key=lambda sprite: (-sprite["image"].height, sprite["label"])):
+            width, height = sprite["image"].size
+            if width == 0 or height == 0:
+                sprite["sheet"], sprite["position"] = None, (0, 0)
+                continue
+            if width > self.size or height > self.size:
+                sheets.append([width, height])
+                sprite["sheet"], sprite["position"] = len(sheets) - 1, (0, 0)
+                continue
+            if current is not None and x + width > self.size:
+                x, y, shelf_height = 0, y + shelf_height + self.PADDING, 0
+            if current is None or y + height > self.size:
+                sheets.append([self.size, self.size])
+                current = len(sheets) - 1
+                x = y = shelf_height = 0
+            sprite["sheet"], sprite["position"] = current, (x, y)
+            x += width + self.PADDING
+            shelf_height = max(shelf_height, height)
+        # The sheets are cropped to the area their sprites use.
+        for sheet in sheets:
+            sheet[0] = sheet[1] = 0
+        for sprite in self.sprites:
+            if sprite["sheet"] is not None:
+                sheet = sheets[sprite["sheet"]]
+                sheet[0] = max(sheet[0], sprite["position"][0] + sprite["image"].width)
+                sheet[1] = max(sheet[1], sprite["position"][1] + sprite["image"].height)
+        return sheets
+
+    def close(self):
+        with self.lock:
+            sheets = self.pack()
+            names = [f"atlas-{index:05d}.png" for index in range(len(sheets))]
+            for index, (width, height) in enumerate(sheets):
+                sheet = self.Image.new("RGBA", (width, height), (0, 0, 0, 0))
+                for sprite in self.sprites:
+                    if sprite["sheet"] == index:
+                        sheet.paste(sprite["image"], sprite["position"])
+                sheet.save(os.path.join(self.output_path, names[index]), "PNG")
+            poses = dict()
+            for sprite in sorted(self.sprites, key=lambda sprite: sprite["label"]):
+                poses[sprite["label"]] = {"pose": [[finger, status] for finger, status in sprite["hand_pose"]],
+                                          "fingers": {finger: status for finger, status in sprite["hand_pose"]},
+                                          "sheet": sprite["sheet"],
+                                          "x": sprite["position"][0], "y": sprite["position"][1],
+                                          "width": sprite["image"].width, "height": sprite["image"].height,
+                                          "offset": list(sprite["box"][:2]),
+                                          "source_size": list(sprite["size"])}
+            for label, hand_pose, original in self.aliases:
+                poses[label] = dict(poses[original])
+                poses[label].update({"pose": [[finger, status] for finger, status in hand_pose],
+                                     "fingers": {finger: status for finger, status in hand_pose},
+                                     "alias": original})
+            poses = dict(sorted(poses.items()))
+            atlas = {"version": self.VERSION, "sheets": names, "poses": poses}
+            index_path = os.path.join(self.output_path, self.INDEX_FILE_NAME)
+            with open(index_path + ".tmp", "w") as index_file:
+                json.dump(atlas, index_file, indent=1)
+            os.replace(index_path + ".tmp", index_path)
+            self.logit(f"Packed {len(self.sprites)} hand poses into {len(sheets)} sprite sheets indexed by " +
+                       f"'{index_path}'")
+
+class MultiResolutionSink(object):
+    """Forwards the hand poses, rendered at the highest DPI, to the sink of every DPI, downsampled to it."""
+
+    def __init__(self, sinks: list, Image):
+        self.sinks = sinks
+        self.Image = Image
+
+    def add(self, label: str, hand_pose: list, png: bytes):
+        with self.Image.open(io.BytesIO(png)) as image:
+            image = image.convert("RGBA")
+        resolutions = dict(iter_resolutions(image, [dpi for dpi, _ in self.sinks], self.Image))
+        for dpi, sink in self.sinks:
+            buffer = io.BytesIO()
+            resolutions[dpi].save(buffer, "PNG")
+            sink.add(label, hand_pose, buffer.getvalue())
+
+    def alias(self, label: str, hand_pose: list, original: str):
+        for _, sink in self.sinks:
+            sink.alias(label, hand_pose, original)
+
+    def close(self):
+        for _, sink in self.sinks:
+            sink.close()
+
+class PoseHasher(object):
+    """Hashes what a hand pose looks like: the serialized subtrees of its visible layers, the content of the document
+       shared by every hand pose and the render settings. Editing a layer hence only changes the hashes of the hand
+       poses in which it is visible.
+    """
+
+    def __init__(self, document, layers: dict):
+        self.layer_hashes = dict()
+        sources = [spec.layer.source for specs in layers.values() for spec in specs]
+        for source in sources:
+            self.layer_hashes[source.get("id")] = PoseHasher.hash(etree.tostring(source, with_tail=False))
+
+        # The shared content is the document with a bare placeholder in place of every exported layer.
+        doc = copy.deepcopy(document)
+        ids = set(self.layer_hashes)
+        for layer in list(doc.getroot().iter()):
+            if layer.get("id") not in ids or any(ancestor.get("id") in ids for ancestor in layer.iterancestors()):
+                continue
+            placeholder = etree.Element("placeholder", id=layer.get("id"))
+            placeholder.tail = layer.tail
+            layer.getparent().replace(layer, placeholder)
+        self.shared_hash = PoseHasher.hash(etree.tostring(doc))
+
+    @staticmethod
+    def hash(data: bytes) -> str:
+        return hashlib.sha256(data).hexdigest()
+
+    def digest(self, show: list, hide: list, settings: dict) -> str:
+        hidden = set(hide)
+        visible = sorted(set(id for id in show if id not in hidden))
+        description = {"shared": self.shared_hash, 
+                       "visible": [[id, self.layer_hashes.get(id)] for id in visible],
+                       "hidden": sorted(hidden),
+                       "settings": settings}
+        return PoseHasher.hash(json.dumps(description, sort_keys=True).encode("utf-8"))
+
+class ExportManifest(object):
+    """The record of the files exported in the output directory, with the hash of the hand pose each one shows.
+       It allows to skip the hand poses whose file is up to date and to prune the files of the removed hand poses.
+    """
+
+    FILE_NAME = ".export-hand-poses.json"
+    VERSION = 2
+
+    def __init__(self, output_path: str, hasher: PoseHasher, logit):
+        self.output_path = output_path
+        self.path = os.path.join(output_path, ExportManifest.FILE_NAME)
+        self.hasher = hasher
+        self.logit = logit
+        self.entries = dict()
+        self.expected = dict()
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, "r") as manifest_file:
+                    manifest = json.load(manifest_file)
+                if manifest.get("version") == ExportManifest.VERSION:
+                    self.entries = manifest["poses"]
+            except (OSError, ValueError, KeyError) as error:
+                logit(f"Ignoring the unreadable manifest {self.path}: {error}")
+
+    def expect(self, label: str, file_names: list, show: list, hide: list, settings: dict) -> bool:
+        """Remembers the hash of the hand pose about to be exported and returns False if its files are up to date."""
+        entry = {"files": file_names, "hash": self.hasher.digest(show, hide, settings)}
+        self.expected[label] = entry
+        return self.entries.get(label) != entry or \
+               not all(os.path.exists(os.path.join(self.output_path, file_name)) for file_name in file_names)
+
+    def record(self, label: str):
+        """Records that the expected files of the hand pose were exported."""
+        entry = self.expected.pop(label)
+        previous = self.entries.get(label)
+        self.entries[label] = entry
+        if previous is not None:
+            for file_name in set(previous["files"]) - set(entry["files"]):
+                self.remove_file(file_name)
+
+    def prune(self, labels: list):
+        """Removes the files of the hand poses which are not part of the given labels anymore."""
+        labels = set(labels)
+        for label in sorted(set(self.entries) - labels):
+            self.logit(f"Pruning '{label}' which is not a hand pose anymore")
+            for file_name in self.entries.pop(label)["files"]:
+                self.remove_file(file_name)
+
+    def remove_file(self, file_name: str):
+        if any(file_name in entry["files"] for entry in self.entries.values()):
+            return
+        path = os.path.join(self.output_path, file_name)
+        if os.path.exists(path):
+            os.remove(path)
+
+    def save(self):
+        manifest = {"version": ExportManifest.VERSION, "poses": dict(sorted(self.entries.items()))}
+        temporary_path = self.path + ".tmp"
+        with open(temporary_path, "w") as manifest_file:
+            json.dump(manifest, manifest_file, indent=2)
+        os.replace(temporary_path, self.path)
+
+class ExportWorkers(object):
+    """The worker pool on which the hand poses are exported, along with the renderer they share. The rendering 
+       itself happens in inkscape subprocesses, or in a process pool with CairoSVG, hence threads are enough to keep
+       every core busy.
+    """
+
+    def __init__(self, jobs: int, renderer: str, logit):
+        self.renderer = create_renderer(renderer, jobs, logit)
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=jobs)
+
+    def submit(self, function, *args):
+        return self.executor.submit(function, *args)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.executor.shutdown(wait=True)
+        self.renderer.close()
+
+def boolean_arg(value: str) -> bool:
+    """Parses the 'true' and 'false' values of the boolean options, as given by Inkscape."""
+    if isinstance(value, bool):
+        return value
+    if value.lower() in ("true", "1", "yes"):
+        return True
+    if value.lower() in ("false", "0", "no"):
+        return False
+    raise argparse.ArgumentTypeError(f"expected a boolean value instead of '{value}'")
+
+@contextlib.contextmanager
+def replacing_file(path: str):
+    """Yields a temporary path, with the same extension, which replaces `path` once written. The exported files are
+       hence never written through, which would also change the duplicate hand poses hard linked to them.
+    """
+    root, extension = os.path.splitext(path)
+    temporary_path = f"{root}.tmp-{os.getpid()}-{threading.get_ident()}{extension}"
+    try:
+        yield temporary_path
+        os.replace(temporary_path, path)
+    finally:
+        if os.path.exists(temporary_path):
+            os.remove(temporary_path)
+
+def link_or_copy(source: str, destination: str, link: bool):
+    """Hard links the destination to the source, or copies it if not `link` or if the file system cannot link."""
+    if os.path.lexists(destination):
+        os.remove(destination)
+    if link:
+        try:
+            os.link(source, destination)
+            return
+        except OSError:
+            pass
+    shutil.copyfile(source, destination)
+
+def pose_selection_arg(value: str) -> str:
+    """Checks the --select option, parsed by PoseFilter when filtering."""
+    try:
+        PoseFilter.parse(value)
+    except ValueError as error:
+        raise argparse.ArgumentTypeError(str(error))
+    return value
+
+def dpi_list_arg(value) -> list:
+    """Parses the comma separated DPIs of the --dpi option, returned from the highest to the lowest."""
+    if isinstance(value, (int, float)):
+        return [float(value)]
+    try:
+        dpis = sorted(set(float(dpi) for dpi in str(value).split(",") if dpi.strip()), reverse=True)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected comma separated DPIs instead of '{value}'")
+    if not dpis or dpis[-1] <= 0:
+        raise argparse.ArgumentTypeError(f"expected positive DPIs instead of '{value}'")
+    return dpis
+
+def format_dpi(dpi: float) -> str:
+    """Names the subdirectory of a DPI, as in '300' or '72.5'."""
+    return f"{dpi:g}"
+
+def iter_resolutions(image, dpis: list, Image):
+    """Yields each DPI with the image, rendered at the first and highest DPI, downsampled to it with a Lanczos 
+       filter. The colors are premultiplied by the alpha while resampling so that transparent pixels do not bleed.
+    """
+    for dpi in dpis:
+        if dpi == dpis[0]:
+            yield dpi, image
+            continue
+        size = (max(1, round(image.width * dpi / dpis[0])), max(1, round(image.height * dpi / dpis[0])))
+        yield dpi, image.convert("RGBa").resize(size, Image.LANCZOS).convert("RGBA")
+
+def load_svg(path: str):
+    parser = etree.XMLParser(huge_tree=True)
+    return etree.parse(path, parser=parser)
+
+def find_svg_files(sources: list) -> list:
+    """Returns the given SVG files, with the directories replaced by the SVG files they contain."""
+    svg_paths = list()
+    for source in sources:
+        source = os.path.expanduser(source)
+        if os.path.isdir(source):
+            svg_paths.extend(sorted(os.path.join(source, name) for name in os.listdir(source) 
+                                    if name.lower().endswith(".svg")))
+        else:
+            svg_paths.append(source)
+    return svg_paths
+
+class Instrumentation(object):
+    """Times the stages of the export. Each stage is emitted as a JSON line event, with the label of the hand pose
+       being exported, its wall time and whatever its context manager adds, such as bytes written or exit codes.
+    """
+
+    def __init__(self, events_path: str = ""):
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.durations = dict()
+        self.events_file = open(os.path.expanduser(events_path), "w") if events_path else None
+
+    @contextlib.contextmanager
+    def stage(self, stage: str, **fields):
+        """Times the stage. The label and view of a stage are inherited by the stages nested in it."""
+        inherited = getattr(self.local, "fields", dict())
+        event = {"event": "stage", "stage": stage}
+        event.update(inherited)
+        event.update({key: value for key, value in fields.items() if value is not None})
+        self.local.fields = {key: event[key] for key in ("label", "view") if key in event}
+        start = time.perf_counter()
+        try:
+            yield event
+            event["ok"] = True
+        except BaseException as error:
+            event["ok"] = False
+            event["error"] = str(error)
+            raise
+        finally:
+            event["seconds"] = time.perf_counter() - start
+            self.local.fields = inherited
+            self.record(event)
+
+    def record(self, event: dict):
+        with self.lock:
+            self.durations.setdefault(event["stage"], list()).append(event["seconds"])
+            if self.events_file is not None:
+                self.events_file.write(json.dumps(event) + "\n")
+                self.events_file.flush()
+
+    @staticmethod
+    def percentile(sorted_durations: list, fraction: float) -> float:
+        index = max(0, int(-(-fraction * len(sorted_durations) // 1)) - 1)
+        return sorted_durations[index]
+
+    def summary(self) -> str:
+        lines = [f"{'stage':10} {'count':>7} {'p50 (s)':>10} {'p95 (s)':>10} {'total (s)':>10}"]
+        with self.lock:
+            for stage, durations in self.durations.items():
+                durations = sorted(durations)
+                lines.append(f"{stage:10} {len(durations):7d} {Instrumentation.percentile(durations, 0.5):10.4f} " +
+                             f"{Instrumentation.percentile(durations, 0.95):10.4f} {sum(durations):10.4f}")
+            poses = len(self.durations.get("pose", [])) + len(self.durations.get("duplicate", []))
+            run = sum(self.durations.get("run", []))
+        lines.append(f"{poses} hand poses exported in {run:.2f}s ({poses / run if run > 0 else 0.0:.2f} poses/s)")
+        return "\n".join(lines)
+
+    def close(self):
+        if self.events_file is not None:
+            self.events_file.close()
+            self.events_file = None
+
+######################################################################################################################
+
+def import_imaging_module():
+    """Imports Pillow to encode the JPEG images in process, returning None if it is not installed."""
+    try:
+        from PIL import Image
+    except ImportError:
+        return None
+    return Image
+
+def encode_jpeg(image, Image, quality: int) -> bytes:
+    """Flattens the image over a white background, as JPEG has no transparency, and encodes it."""
+    image = image.convert("RGBA")
+    flattened = Image.new("RGB", image.size, (255, 255, 255))
+    flattened.paste(image, mask=image.getchannel("A"))
+    buffer = io.BytesIO()
+    flattened.save(buffer, "JPEG", quality=quality)
+    return buffer.getvalue()
+
+def import_compositing_modules():
+    """Imports numpy and Pillow only when compositing, so that the default export does not depend on them."""
+    try:
+        import numpy
+        from PIL import Image
+    except ImportError as error:
+        raise RuntimeError(f"--composite requires numpy and Pillow to be installed: {error}")
+    return numpy, Image
+
+def load_rgba(path: str, numpy, Image):
+    with Image.open(path) as image:
+        return numpy.asarray(image.convert("RGBA"))
+
+def hide_drawing(element, keep: set):
+    """Hides an element that is painted, leaving the definitions and the editor data untouched."""
+    if element in keep or not isinstance(element.tag, str):
+        return
+    if etree.QName(element).localname in ("defs", "namedview", "metadata", "title", "desc", "style", "script"):
+        return
+    element.attrib['style'] = 'display:none'
+
+class LayerCompositor(object):
+    """Composites hand poses from the render of the untagged content and the renders of the tagged layers."""
+
+    def __init__(self, base_path: str, layer_paths: list, numpy, Image):
+        self.numpy = numpy
+        self.Image = Image
+        base = load_rgba(base_path, numpy, Image)
+        self.base = LayerBuffer(base, numpy)
+        # The layers are kept in the order in which they are painted
+        self.layers = list()
+        for id, layer_path in layer_paths:
+            buffer = LayerBuffer(load_rgba(layer_path, numpy, Image), numpy)
+            if buffer.shape != self.base.shape:
+                raise RuntimeError(f"layer '{id}' was rendered as {buffer.shape} instead of {self.base.shape}")
+            self.layers.append((id, buffer))
+
+    def composite(self, show: list, hide: list):
+        canvas = self.base.canvas()
+        for id, buffer in self.layers:
+            if id in show and id not in hide:
+                buffer.composite_over(canvas)
+        return canvas
+
+class LayerBuffer(object):
+    """A rendered layer cropped to its visible pixels and stored with premultiplied alpha, ready to be composited."""
+
+    def __init__(self, rgba, numpy):
+        self.numpy = numpy
+        self.shape = rgba.shape[:2]
+        ys, xs = numpy.nonzero(rgba[:, :, 3])
+        if len(ys) == 0:
+            self.top, self.left, self.pixels = 0, 0, None
+            return
+        self.top, self.left = ys.min(), xs.min()
+        pixels = rgba[self.top:ys.max() + 1, self.left:xs.max() + 1].astype(numpy.float32) / 255.0
+        pixels[:, :, :3] *= pixels[:, :, 3:]
+        self.pixels = pixels
+
+    def canvas(self):
+        """Returns a full size premultiplied copy of this buffer to composite other layers over."""
+        canvas = self.numpy.zeros(self.shape + (4,), dtype=self.numpy.float32)
+        if self.pixels is not None:
+            height, width = self.pixels.shape[:2]
+            canvas[self.top:self.top + height, self.left:self.left + width] = self.pixels
+        return canvas
+
+    def composite_over(self, canvas):
+        """Paints this buffer over the canvas in place with the Porter-Duff 'over' operator."""
+        if self.pixels is None:
+            return
+        height, width = self.pixels.shape[:2]
+        region = canvas[self.top:self.top + height, self.left:self.left + width]
+        region *= 1.0 - self.pixels[:, :, 3:]
+        region += self.pixels
+
+    @staticmethod
+    def to_rgba(canvas, numpy):
+        """Converts a premultiplied canvas back to 8 bits straight RGBA."""
+        alpha = canvas[:, :, 3:]
+        rgb = numpy.divide(canvas[:, :, :3], alpha, out=numpy.zeros_like(canvas[:, :, :3]), where=alpha > 0)
+        rgba = numpy.concatenate([rgb, alpha], axis=2)
+        return numpy.clip(numpy.rint(rgba * 255.0), 0, 255).astype(numpy.uint8)
+
 ######################################################################################################################
 
 class ExportSpec(object):
@@ -471,9 +2259,39 @@ class ExportSpec(object):
 
 ######################################################################################################################
 
+def _parse_arguments(args, prog: str, description: str, nargs, sources_help: str):
+    exporter = HandPoseExporter()
+    parser = argparse.ArgumentParser(prog=prog, description=description)
+    exporter.add_arguments(parser)
+    parser.add_argument("sources", nargs=nargs, metavar="SOURCE", help=sources_help)
+    exporter.options = parser.parse_args(args)
+    return exporter
+
+def _print_listed(listed: list):
+    for label, files in listed:
+        print("\t".join([label] + files))
+    print(f"{len(listed)} hand poses selected", file=sys.stderr)
+
 def _main():
-    effect = ComboExport()
-    effect.run()
+    # Standalone entry point, which does not need the Inkscape extension runtime
+    prog = os.path.basename(sys.argv[0])
+    if sys.argv[1:2] == ["batch"]:
+        batch = _parse_arguments(sys.argv[2:], f"{prog} batch", "Exports the hand poses of several SVG files.", "+", 
+                                 "SVG files or directories of SVG files to export")
+        if batch.options.list:
+            _print_listed(batch.batch_list(batch.options.sources))
+        else:
+            batch.batch_export(batch.options.sources)
+    else:
+        exporter = _parse_arguments(sys.argv[1:], prog, "Exports the hand poses of an SVG file.", "?", 
+                                    "SVG file to export, which --list does not need")
+        if exporter.options.list:
+            _print_listed(exporter.list_hand_poses())
+        elif exporter.options.sources is None:
+            sys.exit(f"{prog}: error: the SVG file to export is required")
+        else:
+            exporter.document = load_svg(exporter.options.sources)
+            exporter.export()
     exit()
 
 if __name__ == "__main__":
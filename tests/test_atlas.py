@@ -0,0 +1,49 @@
+#! /usr/bin/env python3
+#######################################################################################################################
+#  Copyright (c) 2023 Vincent LAMBERT
+#  License: MIT
+#######################################################################################################################
+#
+# Tests of the packing of the hand poses into the sprite sheets of the AtlasSink.
+
+import io
+import os
+import sys
+import logging
+import pytest
+
+REPOSITORY_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPOSITORY_PATH)
+from export_hand_poses import AtlasSink
+
+######################################################################################################################
+
+def make_sink(output_path: str, size: int, sprite_sizes: list):
+    Image = pytest.importorskip("PIL.Image")
+    sink = AtlasSink(output_path, size, Image, logging.debug)
+    for index, sprite_size in enumerate(sprite_sizes):
+        png = io.BytesIO()
+        Image.new("RGBA", sprite_size, (255, 0, 0, 255)).save(png, "PNG")
+        sink.add(f"pose{index}", [], png.getvalue())
+    return sink
+
+def test_oversized_sprites_get_a_sheet_of_their_own(tmp_path):
+    sink = make_sink(str(tmp_path), 100, [(50, 80), (150, 10)])
+    assert sink.pack() == [[50, 80], [150, 10]]
+    assert [(sprite["sheet"], sprite["position"]) for sprite in sink.sprites] == [(0, (0, 0)), (1, (0, 0))]
+
+def test_sprites_fit_in_the_sheets(tmp_path):
+    sink = make_sink(str(tmp_path), 100, [(50, 80), (60, 60), (40, 30), (40, 30), (100, 100), (150, 10)])
+    sheets = sink.pack()
+    for sprite in sink.sprites:
+        width, height = sheets[sprite["sheet"]]
+        x, y = sprite["position"]
+        assert x + sprite["image"].width <= width and y + sprite["image"].height <= height
+        if sprite["image"].width <= 100 and sprite["image"].height <= 100:
+            assert width <= 100 and height <= 100
+    for index, sprite in enumerate(sink.sprites):
+        for other in sink.sprites[index + 1:]:
+            if sprite["sheet"] == other["sheet"]:
+                (x, y), (other_x, other_y) = sprite["position"], other["position"]
+                assert (x + sprite["image"].width <= other_x or other_x + other["image"].width <= x or
+                        y + sprite["image"].height <= other_y or other_y + other["image"].height <= y)
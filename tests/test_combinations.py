@@ -0,0 +1,76 @@
+#! /usr/bin/env python3
+#######################################################################################################################
+#  Copyright (c) 2023 Vincent LAMBERT
+#  License: MIT
+#######################################################################################################################
+#
+# Tests of compute_accepted_combinations against the original implementation, which enumerated the product of every
+# finger status and filtered it.
+
+import os
+import sys
+import itertools
+import pytest
+
+REPOSITORY_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPOSITORY_PATH)
+from export_hand_poses import (compute_accepted_combinations, iter_accepted_combinations, has_multi_joints, has_add_or_abd_joints, 
+                               has_valid_multi_joints, has_valid_add_and_abd_joints, FINGERS, STATUS, 
+                               ACCEPTED_STATUSES, THUMB, INDEX, MIDDLE, UP, DOWN, MULTI_LINK)
+
+######################################################################################################################
+
+def compute_reference_combinations(multi_link_combo, simple_link_combo):
+    """The original product and filter implementation of compute_accepted_combinations."""
+    fingers = [x for x in FINGERS if x != THUMB]
+    finger_status_combinations = itertools.product(STATUS, repeat=len(fingers))
+    finger_accepted_combinations = [[(finger, status) for finger,status in zip(fingers,statuses)] for statuses in finger_status_combinations]
+    finger_accepted_combinations = [combination for combination in finger_accepted_combinations if all([status in ACCEPTED_STATUSES[finger] for finger,status in combination])]
+
+    new_finger_accepted_combinations = []
+    for combination in finger_accepted_combinations :
+        if has_multi_joints(combination) :
+            if multi_link_combo and has_valid_multi_joints(combination) :
+                new_finger_accepted_combinations.append(combination)
+        else :
+            new_finger_accepted_combinations.append(combination)
+    finger_accepted_combinations = new_finger_accepted_combinations
+
+    new_finger_accepted_combinations = []
+    for combination in finger_accepted_combinations :
+        if has_add_or_abd_joints(combination) :
+            if simple_link_combo and has_valid_add_and_abd_joints(combination) :
+                new_finger_accepted_combinations.append(combination)
+        else :
+            new_finger_accepted_combinations.append(combination)
+    finger_accepted_combinations = new_finger_accepted_combinations
+
+    at_least_one_up = [[x[0], x[1][0],x[1][1],x[1][2],x[1][3]]  for x in itertools.product(*[[(THUMB, UP)], finger_accepted_combinations]) if not all([status == DOWN for finger,status in x[1]])]
+    all_closed = [[x[0], x[1][0],x[1][1],x[1][2],x[1][3]]  for x in itertools.product(*[[(THUMB, DOWN)], finger_accepted_combinations]) if all([status == DOWN for finger,status in x[1]])]
+    return at_least_one_up + all_closed
+
+@pytest.mark.parametrize("multi_link_combo, simple_link_combo, count", 
+                         [(False, False, 16), (True, False, 21), (False, True, 29), (True, True, 34)])
+def test_same_combinations_as_reference(multi_link_combo, simple_link_combo, count):
+    combinations = [[tuple(pair) for pair in combination] 
+                    for combination in compute_accepted_combinations(multi_link_combo, simple_link_combo)]
+    reference = compute_reference_combinations(multi_link_combo, simple_link_combo)
+    assert combinations == reference
+    assert len(combinations) == count
+
+def test_rules_discard_the_rejected_poses():
+    def rejects_index_up(combination):
+        return (INDEX, UP) not in combination
+    combinations = list(iter_accepted_combinations(True, True, rules=[rejects_index_up]))
+    reference = [combination for combination in iter_accepted_combinations(True, True) 
+                 if (INDEX, UP) not in combination]
+    assert combinations == reference
+    assert len(combinations) < len(list(iter_accepted_combinations(True, True)))
+
+def test_accepted_statuses_restrict_the_poses():
+    accepted_statuses = dict(ACCEPTED_STATUSES)
+    accepted_statuses[MIDDLE] = [status for status in ACCEPTED_STATUSES[MIDDLE] if status != MULTI_LINK]
+    combinations = list(iter_accepted_combinations(True, True, accepted_statuses=accepted_statuses))
+    reference = [combination for combination in iter_accepted_combinations(True, True) 
+                 if (MIDDLE, MULTI_LINK) not in combination]
+    assert combinations == reference
@@ -0,0 +1,69 @@
+#! /usr/bin/env python3
+#######################################################################################################################
+#  Copyright (c) 2023 Vincent LAMBERT
+#  License: MIT
+#######################################################################################################################
+#
+# Tests that compositing the layer renders gives the same hand poses as rendering each hand pose in full. They need
+# a renderer, Inkscape or CairoSVG, and are skipped when none is available.
+
+import os
+import sys
+import shutil
+import logging
+import argparse
+import contextlib
+import io
+import pytest
+
+REPOSITORY_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPOSITORY_PATH)
+import export_hand_poses
+from export_hand_poses import HandPoseExporter
+
+FIXTURE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "small_hand.svg")
+# Anti-aliased edges may be blended slightly differently by the compositing than by the renderer.
+MAX_DIFFERENCE = 8
+MAX_MEAN_DIFFERENCE = 0.5
+
+######################################################################################################################
+
+def find_renderer():
+    if shutil.which("inkscape"):
+        return "cli"
+    try:
+        export_hand_poses.create_renderer("cairosvg", 1, logging.debug)
+    except RuntimeError:
+        return None
+    return "cairosvg"
+
+def export(output_path: str, renderer: str, composite: bool):
+    exporter = HandPoseExporter()
+    parser = argparse.ArgumentParser()
+    exporter.add_arguments(parser)
+    exporter.options = parser.parse_args([f"--path={output_path}", "--filetype=png", "--dpi=96", "--jobs=2",
+                                          f"--renderer={renderer}", f"--composite={composite}"])
+    exporter.document = export_hand_poses.load_svg(FIXTURE_PATH)
+    with contextlib.redirect_stdout(io.StringIO()):
+        exporter.export()
+
+def test_composite_matches_full_render(tmp_path):
+    numpy = pytest.importorskip("numpy")
+    Image = pytest.importorskip("PIL.Image")
+    renderer = find_renderer()
+    if renderer is None:
+        pytest.skip("neither Inkscape nor CairoSVG with the cairo library is available")
+
+    export(str(tmp_path / "full"), renderer, False)
+    export(str(tmp_path / "composite"), renderer, True)
+    names = sorted(name for name in os.listdir(tmp_path / "full") if name.endswith(".png"))
+    assert names
+    assert names == sorted(name for name in os.listdir(tmp_path / "composite") if name.endswith(".png"))
+    for name in names:
+        with Image.open(tmp_path / "full" / name) as full, Image.open(tmp_path / "composite" / name) as composite:
+            assert full.size == composite.size, name
+            full = numpy.asarray(full.convert("RGBA"), dtype=numpy.int16)
+            composite = numpy.asarray(composite.convert("RGBA"), dtype=numpy.int16)
+        difference = numpy.abs(full - composite)
+        assert difference.max() <= MAX_DIFFERENCE, name
+        assert difference.mean() <= MAX_MEAN_DIFFERENCE, name
@@ -0,0 +1,43 @@
+#! /usr/bin/env python3
+#######################################################################################################################
+#  Copyright (c) 2023 Vincent LAMBERT
+#  License: MIT
+#######################################################################################################################
+#
+# Tests that the Inkscape extension accepts the params of export_hand_poses.inx, as Inkscape passes them.
+
+import os
+import sys
+import pytest
+from lxml import etree
+
+REPOSITORY_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPOSITORY_PATH)
+
+INX_PATH = os.path.join(REPOSITORY_PATH, "export_hand_poses.inx")
+INX_NAMESPACES = {"inx": "http://www.inkscape.org/namespace/inkscape/extension"}
+
+######################################################################################################################
+
+def get_inx_params() -> list:
+    """Returns the name and the default value of every param which Inkscape passes to the extension."""
+    params = list()
+    for param in etree.parse(INX_PATH).iterfind("inx:param", INX_NAMESPACES):
+        if param.get("type") == "description":
+            continue
+        options = param.findall("inx:option", INX_NAMESPACES)
+        if options:
+            selected = [option for option in options if option.get("selected") == "selected"] or options
+            params.append((param.get("name"), selected[0].get("value")))
+        else:
+            params.append((param.get("name"), param.text or ""))
+    return params
+
+def test_extension_accepts_every_inx_param():
+    pytest.importorskip("inkex")
+    from export_hand_poses_effect import ComboExport
+    params = get_inx_params()
+    assert params
+    options = ComboExport().arg_parser.parse_args([f"--{name}={value}" for name, value in params])
+    for name, _ in params:
+        assert hasattr(options, name), name
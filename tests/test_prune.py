@@ -0,0 +1,54 @@
+#! /usr/bin/env python3
+#######################################################################################################################
+#  Copyright (c) 2023 Vincent LAMBERT
+#  License: MIT
+#######################################################################################################################
+#
+# Tests of the PrunedLayerTemplate, which leaves the hidden layers and the unused definitions out of each hand pose.
+
+import os
+import sys
+from lxml import etree
+
+REPOSITORY_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPOSITORY_PATH)
+from export_hand_poses import PrunedLayerTemplate
+
+######################################################################################################################
+
+def make_document(defs: str, layers: str):
+    return etree.ElementTree(etree.fromstring(
+        '<svg xmlns="http://www.w3.org/2000/svg" xmlns:xlink="http://www.w3.org/1999/xlink" '
+        'xmlns:inkscape="http://www.inkscape.org/namespaces/inkscape" '
+        'xmlns:sodipodi="http://sodipodi.sourceforge.net/DTD/sodipodi-0.dtd" width="10" height="10">'
+        f'<defs>{defs}</defs>{layers}</svg>'))
+
+def test_style_sheet_and_its_references_are_kept():
+    document = make_document('<style>.a{fill:url(#g)}</style>'
+                             '<linearGradient id="g"><stop offset="0" stop-color="red"/></linearGradient>'
+                             '<linearGradient id="unused"/>',
+                             '<g id="layer" inkscape:groupmode="layer"><rect class="a" width="5" height="5"/></g>')
+    rendered = PrunedLayerTemplate(document).render(["layer"], [])
+    root = etree.fromstring(rendered)
+    namespaces = {"svg": "http://www.w3.org/2000/svg"}
+    assert root.find(".//svg:style", namespaces).text == ".a{fill:url(#g)}"
+    assert root.find('.//svg:linearGradient[@id="g"]', namespaces) is not None
+    assert root.find('.//svg:linearGradient[@id="unused"]', namespaces) is None
+    assert root.find(".//svg:rect", namespaces).get("class") == "a"
+
+def test_scripts_and_fonts_are_kept():
+    document = make_document('<script>var a = 1;</script><font id="f"><glyph unicode="a"/></font>',
+                             '<g id="layer" inkscape:groupmode="layer"><text>a</text></g>')
+    root = etree.fromstring(PrunedLayerTemplate(document).render(["layer"], []))
+    namespaces = {"svg": "http://www.w3.org/2000/svg"}
+    assert root.find(".//svg:script", namespaces) is not None
+    assert root.find('.//svg:font[@id="f"]/svg:glyph', namespaces) is not None
+
+def test_hidden_layer_is_removed():
+    document = make_document('<linearGradient id="g"/>',
+                             '<g id="shown" inkscape:groupmode="layer"><rect width="5" height="5"/></g>'
+                             '<g id="hidden" inkscape:groupmode="layer"><rect fill="url(#g)" width="5" height="5"/></g>')
+    root = etree.fromstring(PrunedLayerTemplate(document).render(["shown"], ["hidden"]))
+    assert root.find('.//*[@id="hidden"]') is None
+    assert root.find('.//*[@id="g"]') is None
+    assert root.find('.//*[@id="shown"]') is not None
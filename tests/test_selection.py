@@ -0,0 +1,23 @@
+#! /usr/bin/env python3
+#######################################################################################################################
+#  Copyright (c) 2023 Vincent LAMBERT
+#  License: MIT
+#######################################################################################################################
+#
+# Tests of the selection of the exported hand poses by finger status.
+
+import os
+import sys
+
+REPOSITORY_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPOSITORY_PATH)
+from export_hand_poses import PoseFilter, select_hand_poses
+
+######################################################################################################################
+
+def test_repeated_finger_conditions_are_intersected():
+    assert PoseFilter.parse("index=up,index=down") == [{"index": (False, set())}]
+    assert select_hand_poses(selections=["index=up,index=down"]) == []
+    assert (select_hand_poses(selections=["index=up|down,index!=down"]) == 
+            select_hand_poses(selections=["index=up"]))
+    assert select_hand_poses(selections=["index=*,index=up"]) == select_hand_poses(selections=["index=up"])